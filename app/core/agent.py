@@ -2,60 +2,236 @@
 Agente principal do chatbot de folha de pagamento
 Implementa lógica de decisão entre RAG, Web Search e conversa geral
 """
+import json
 import logging
-from typing import Dict, Any, Optional
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
 
-from .llm import LLMConfig
+from .llm import LLMConfig, context_text
 from ..tools.payroll_rag import PayrollRAG
 from ..tools.web_search import WebSearch
 from .conversation_memory import ConversationMemory
+from ..utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+def _normalize(text: str) -> str:
+    """Normaliza texto para comparação (NFC + casefold)"""
+    return unicodedata.normalize("NFC", text).casefold()
+
+def _is_phrase(keyword: str) -> bool:
+    """Indica se a palavra-chave não é um único token (ex.: "como calcular")"""
+    return _TOKEN_PATTERN.fullmatch(keyword) is None
+
+def _word_sets(*groups) -> Dict[str, frozenset]:
+    """Separa, por categoria, as palavras-chave que são um único token"""
+    return {
+        category: frozenset(_normalize(keyword) for keyword in keywords if not _is_phrase(keyword))
+        for category, keywords in groups
+    }
+
+def _index_phrases(*groups) -> Dict[str, frozenset]:
+    """Mapeia cada expressão com várias palavras para as categorias em que aparece"""
+    index: Dict[str, set] = {}
+    for category, keywords in groups:
+        for keyword in keywords:
+            if _is_phrase(keyword):
+                index.setdefault(_normalize(keyword), set()).add(category)
+    return {keyword: frozenset(categories) for keyword, categories in index.items()}
+
+def _compile_phrases(phrases) -> re.Pattern:
+    """Compila expressões em uma única alternância de palavras inteiras (maiores primeiro)"""
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile(r'\b(?:' + '|'.join(re.escape(phrase) for phrase in ordered) + r')\b')
+
+def _compile_small_talk(buckets) -> re.Pattern:
+    """Compila padrão que aceita mensagens formadas só por palavras-chave dos grupos"""
+    keywords = sorted({_normalize(keyword) for keywords, _ in buckets for keyword in keywords},
+                      key=len, reverse=True)
+    term = r'(?:' + '|'.join(re.escape(keyword) for keyword in keywords) + r')'
+    return re.compile(r'[\W_]*' + term + r'(?:[\W_]+' + term + r')*[\W_]*')
+
+def _index_buckets(buckets) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Mapeia palavras e expressões para o índice do primeiro grupo que as contém"""
+    words: Dict[str, int] = {}
+    phrases: Dict[str, int] = {}
+    for index, (keywords, _) in enumerate(buckets):
+        for keyword in keywords:
+            (phrases if _is_phrase(keyword) else words).setdefault(_normalize(keyword), index)
+    return words, phrases
+
+def _build_tool_prompt(message: str, source: str, data: Any, evidence: Any,
+                       evidence_label: str, use_hint: str) -> str:
+    """
+    Monta o prompt enviado ao LLM a partir do resultado de uma ferramenta
+    
+    Args:
+        message: Mensagem do usuário
+        source: Origem dos dados (ex.: "nos dados da folha de pagamento")
+        data: Resposta da ferramenta
+        evidence: Evidências/fontes encontradas
+        evidence_label: Rótulo das evidências no prompt
+        use_hint: Complemento da instrução final (ex.: "os dados encontrados")
+        
+    Returns:
+        Prompt em texto
+    """
+    segments = [
+        f"O usuário perguntou: '{message}'.",
+        f"Baseado {source}, encontrei: '{data}'."
+    ]
+    if evidence:
+        # JSON compacto em vez de repr(): menos tokens e formato previsível
+        segments.append(f"{evidence_label}: " + json.dumps(
+            evidence, ensure_ascii=False, separators=(",", ":"), default=str
+        ))
+    segments.append(
+        "Transforme isso em uma resposta conversacional, natural e amigável, "
+        f"como se você fosse um assistente pessoal. Use {use_hint} "
+        "mas seja fluido e natural na resposta."
+    )
+    return "\n".join(segments)
+
 class PayrollAgent:
     """Agente principal que decide qual ferramenta usar"""
     
+    # Palavras-chave para classificação de consultas
+    RAG_KEYWORDS = frozenset({
+        "funcionário", "funcionários", "salário", "salários", "folha", "pagamento",
+        "nome", "cargo", "departamento", "data", "valor", "total", "média", "soma",
+        "quem", "quanto", "quando", "onde", "qual", "recebi", "recebeu", "ganhou",
+        "líquido", "líquida", "bruto", "bruta", "desconto", "descontos", "inss",
+        "irrf", "bônus", "bonus", "trimestre", "semestre", "competência"
+    })
+    
+    WEB_KEYWORDS = frozenset({
+        "lei", "legislação", "direito", "direitos", "trabalhista", "trabalhistas",
+        "clt", "fgts", "inss", "imposto", "tributo", "encargo", "encargos",
+        "como calcular", "como funciona", "o que é", "quando", "prazo",
+        "selic", "taxa", "juros", "férias", "ferias", "13º", "13", "salário"
+    })
+    
+    GENERAL_KEYWORDS = frozenset({
+        "olá", "oi", "bom dia", "boa tarde", "boa noite", "obrigado", "obrigada",
+        "tchau", "até logo", "como você está", "como está", "ajuda", "help",
+        "tudo bem", "beleza", "ok", "certo", "entendi", "perfeito", "legal",
+        "bacana", "show", "massa", "top", "como vai", "e aí", "eae",
+        "tranquilo", "suave", "valeu", "brigado", "brigada",
+        "até mais", "até", "falou", "flw", "abraço", "abraços",
+        "conversa", "falar", "falei", "disse", "comentou", "mencionou",
+        "lembra", "lembro", "lembrar", "esqueci", "esqueceu", "esquecer",
+        "sabia", "sabe", "saber", "conhece", "conhecer", "conhecia",
+        "pode", "poder", "consegue", "conseguir", "quero", "quer", "querer",
+        "preciso", "precisa", "precisar", "gostaria", "gostar",
+        "dúvida", "duvida", "duvido", "duvidar", "pergunta", "perguntar",
+        "questão", "questao", "problema", "solução", "solucao", "resolver",
+        "explicar", "explicação", "explicacao"
+    })
+    
+    # Sobrescritas diretas: nomes de funcionários e termos de legislação
+    NAME_OVERRIDES = frozenset({"ana", "bruno", "souza", "lima"})
+    LEGAL_OVERRIDES = frozenset({
+        "lei", "leis", "direito", "direitos", "trabalhista", "trabalhistas",
+        "clt", "fgts", "inss", "como calcular",
+        "como funciona", "selic", "taxa selic", "juros", "férias", "ferias",
+        "previdência", "previdencia"
+    })
+    
+    # Consultas com pontuações próximas de RAG e web viram "hybrid" (folha
+    # primeiro, web se faltar dado); desligado, vale a maior pontuação
+    HYBRID_ROUTING = os.getenv("HYBRID_ROUTING", "false").lower() in ("1", "true")
+    
+    # Tipos de consulta cujas respostas não dependem do histórico da conversa
+    CACHEABLE_QUERY_TYPES = frozenset({"rag", "web", "hybrid"})
+    
+    # Respostas prontas quando o LLM falha, em ordem de prioridade
+    FALLBACK_REPLIES = (
+        # Saudações
+        (("olá", "oi", "bom dia", "boa tarde", "boa noite", "e aí", "eae", "como vai"),
+         "Olá! 😊 Estou aqui para ajudar com questões de folha de pagamento. Como posso te auxiliar hoje?"),
+        # Agradecimentos
+        (("obrigado", "obrigada", "valeu", "brigado", "brigada"),
+         "De nada! 😊 Fico feliz em poder ajudar. Precisa de mais alguma coisa sobre folha de pagamento?"),
+        # Como está
+        (("como você está", "como está", "tudo bem", "beleza", "tranquilo", "suave"),
+         "Estou ótimo, obrigado por perguntar! 😊 Pronto para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"),
+        # Confirmações
+        (("ok", "certo", "entendi", "perfeito", "legal", "bacana", "show", "massa", "top"),
+         "Perfeito! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"),
+        # Despedidas
+        (("tchau", "até logo", "até mais", "até", "falou", "flw", "abraço", "abraços"),
+         "Até logo! 😊 Foi um prazer ajudar. Volte sempre que precisar de informações sobre folha de pagamento!"),
+        # Perguntas sobre o que pode fazer
+        (("o que você faz", "o que você pode", "como você pode", "o que consegue", "o que sabe"),
+         "Posso ajudar com várias coisas! 😊 Consultar dados de folha de pagamento, buscar informações sobre legislação trabalhista, e conversar sobre qualquer assunto relacionado. O que você gostaria de saber?"),
+        # Perguntas sobre ajuda
+        (("ajuda", "help", "pode ajudar", "consegue ajudar", "preciso de ajuda"),
+         "Claro que posso ajudar! 😊 Posso consultar dados de folha de pagamento, buscar informações sobre legislação trabalhista, e responder qualquer pergunta relacionada. O que você gostaria de saber?"),
+        # Perguntas sobre dúvidas
+        (("dúvida", "duvida", "duvido", "pergunta", "questão", "questao", "problema"),
+         "Estou aqui para esclarecer suas dúvidas! 😊 Posso ajudar com questões de folha de pagamento, legislação trabalhista, ou qualquer outra pergunta. O que você gostaria de saber?"),
+        # Conversas sobre lembrar
+        (("lembra", "lembro", "lembrar", "esqueci", "esqueceu", "esquecer"),
+         "Sim, lembro! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"),
+        # Conversas sobre saber/conhecer
+        (("sabia", "sabe", "saber", "conhece", "conhecer", "conhecia"),
+         "Sim, sei várias coisas! 😊 Posso ajudar com dados de folha de pagamento, legislação trabalhista, e muito mais. O que você gostaria de saber?"),
+        # Conversas sobre poder/conseguir
+        (("pode", "poder", "consegue", "conseguir", "quero", "quer", "querer", "preciso", "precisa", "precisar", "gostaria"),
+         "Claro que posso! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"),
+        # Conversas sobre falar/conversar
+        (("conversa", "falar", "falei", "disse", "comentou", "mencionou"),
+         "Adoro conversar! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"),
+    )
+    RAG_ERROR_REPLY = (
+        "Desculpe, não consegui consultar os dados de folha no momento. "
+        "Tente novamente em alguns instantes."
+    )
+    WEB_ERROR_REPLY = (
+        "Desculpe, não consegui buscar informações na web no momento. "
+        "Tente novamente em alguns instantes."
+    )
+    WEB_UNAVAILABLE_REPLY = (
+        "Ops! Não consegui acessar as informações na web no momento. 😊 Mas não se preocupe! "
+        "Tente novamente em alguns instantes que vou buscar para você. "
+        "Ou posso ajudar com outras questões sobre folha de pagamento!"
+    )
+    DEFAULT_FALLBACK_REPLY = (
+        "Entendi! 😊 Posso ajudar com consultas sobre dados de folha de pagamento, informações "
+        "sobre funcionários, ou questões gerais sobre legislação trabalhista. O que você gostaria de saber?"
+    )
+    
+    # Índices montados uma vez na importação. Palavras simples são comparadas
+    # por interseção com os tokens da mensagem (hash em C, sem falsos positivos
+    # como "oi" dentro de "foi"); só as poucas expressões com várias palavras
+    # são procuradas com uma alternância compilada.
+    _KEYWORD_GROUPS = (
+        ("rag", RAG_KEYWORDS),
+        ("web", WEB_KEYWORDS),
+        ("general", GENERAL_KEYWORDS),
+        ("_legal", LEGAL_OVERRIDES),
+    )
+    _WORD_SETS = _word_sets(*_KEYWORD_GROUPS)
+    _PHRASE_CATEGORIES = _index_phrases(*_KEYWORD_GROUPS)
+    _PHRASE_PATTERN = _compile_phrases(_PHRASE_CATEGORIES)
+    _FALLBACK_WORDS, _FALLBACK_PHRASES = _index_buckets(FALLBACK_REPLIES)
+    _FALLBACK_PATTERN = _compile_phrases(_FALLBACK_PHRASES)
+    # Saudações, agradecimentos, "tudo bem?", confirmações e despedidas puras
+    # recebem a resposta pronta, sem chamar o LLM
+    _SMALL_TALK_PATTERN = _compile_small_talk(FALLBACK_REPLIES[:5])
+    
     def __init__(self):
         """Inicializa o agente"""
         self.llm = LLMConfig()
         self.rag = PayrollRAG()
         self.web_search = WebSearch()
         self.memory = ConversationMemory()
-        
-        # Palavras-chave para classificação de consultas
-        self.rag_keywords = [
-            "funcionário", "funcionários", "salário", "salários", "folha", "pagamento",
-            "nome", "cargo", "departamento", "data", "valor", "total", "média", "soma",
-            "quem", "quanto", "quando", "onde", "qual", "recebi", "recebeu", "ganhou",
-            "líquido", "líquida", "bruto", "bruta", "desconto", "descontos", "inss",
-            "irrf", "bônus", "bonus", "trimestre", "semestre", "competência"
-        ]
-        
-        self.web_keywords = [
-            "lei", "legislação", "direito", "direitos", "trabalhista", "trabalhistas",
-            "clt", "fgts", "inss", "imposto", "tributo", "encargo", "encargos",
-            "como calcular", "como funciona", "o que é", "quando", "prazo", "prazo",
-            "selic", "taxa", "juros", "férias", "ferias", "13º", "13", "salário"
-        ]
-        
-        self.general_keywords = [
-            "olá", "oi", "bom dia", "boa tarde", "boa noite", "obrigado", "obrigada",
-            "tchau", "até logo", "como você está", "como está", "ajuda", "help",
-            "tudo bem", "beleza", "ok", "certo", "entendi", "perfeito", "legal",
-            "bacana", "show", "massa", "top", "massa", "bacana", "show", "massa",
-            "como vai", "e aí", "eae", "e aí", "beleza", "tranquilo", "suave",
-            "valeu", "brigado", "brigada", "obrigad", "obrigad", "valeu", "brigado",
-            "até mais", "até", "tchau", "falou", "flw", "abraço", "abraços",
-            "conversa", "falar", "falei", "disse", "comentou", "mencionou",
-            "lembra", "lembro", "lembrar", "esqueci", "esqueceu", "esquecer",
-            "sabia", "sabia", "sabe", "saber", "conhece", "conhecer", "conhecia",
-            "pode", "poder", "consegue", "conseguir", "quero", "quer", "querer",
-            "preciso", "precisa", "precisar", "gostaria", "gostaria", "gostar",
-            "dúvida", "duvida", "duvido", "duvidar", "pergunta", "perguntar",
-            "questão", "questao", "questão", "questao", "problema", "problema",
-            "solução", "solucao", "solução", "solucao", "resolver", "resolver",
-            "explicar", "explicar", "explicação", "explicacao", "explicação", "explicacao"
-        ]
+        self._response_cache = TTLCache(maxsize=1000, ttl=3600)
     
     async def process_query(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -69,40 +245,18 @@ class PayrollAgent:
             Resposta processada
         """
         try:
-            # Cria sessão se não existir
-            if session_id is None:
-                session_id = self.memory.create_session()
-            
-            # Adiciona mensagem do usuário à memória
-            self.memory.add_message(session_id, "user", message)
-            
-            # Analisa o tipo de consulta
-            query_type = await self._analyze_query_type(message)
-            
-            # Obtém contexto da conversa
-            context = self.memory.get_context_summary(session_id)
-            
-            # Processa consulta baseada no tipo
-            if query_type == "rag":
-                result = await self._process_rag_query(message, context)
-            elif query_type == "web":
-                result = await self._process_web_query(message, context)
-            else:
-                result = await self._process_general_query(message, context)
+            session_id, query_type, message_lower, context, cache_key = self._start_turn(message, session_id)
             
-            # Adiciona resposta à memória
-            self.memory.add_message(
-                session_id, 
-                "assistant", 
-                result["response"],
-                tool_used=result["tool_used"],
-                evidence=result.get("evidence")
-            )
+            # Consultas repetidas de dados/legislação são respondidas do cache
+            result = self._cached_result(query_type, cache_key)
             
-            # Atualiza contexto
-            self.memory.update_context_data(session_id, "last_query_type", query_type)
-            self.memory.update_context_data(session_id, "last_tool_used", result["tool_used"])
+            if result is None:
+                # Executa a ferramenta e gera a resposta com o LLM
+                plan = await self._plan_reply(message, query_type, message_lower)
+                result = await self._complete_reply(plan, context)
+                self._store_result(query_type, cache_key, result, plan)
             
+            self._finish_turn(session_id, query_type, result)
             return result
             
         except Exception as e:
@@ -113,39 +267,187 @@ class PayrollAgent:
                 "tool_used": "error"
             }
     
-    async def _analyze_query_type(self, message: str) -> str:
+    async def process_query_stream(
+        self, 
+        message: str, 
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Analisa o tipo de consulta
+        Processa consulta do usuário transmitindo a resposta em partes
+        
+        Emite um evento "meta" (sessão, ferramenta e evidências) assim que a
+        ferramenta responde, eventos "token" com trechos da resposta do LLM
+        e, ao final, "done". Em caso de falha emite "error".
         
         Args:
             message: Mensagem do usuário
+            session_id: ID da sessão (opcional)
+            
+        Yields:
+            Eventos da resposta
+        """
+        try:
+            session_id, query_type, message_lower, context, cache_key = self._start_turn(message, session_id)
+            
+            result = self._cached_result(query_type, cache_key)
+            
+            if result is not None:
+                yield self._meta_event(session_id, result["tool_used"], result.get("evidence"))
+                yield {"event": "token", "content": result["response"]}
+            else:
+                plan = await self._plan_reply(message, query_type, message_lower)
+                yield self._meta_event(session_id, plan["tool_used"], plan["evidence"])
+                
+                parts = []
+                async for part in self._stream_reply(plan, context):
+                    parts.append(part)
+                    yield {"event": "token", "content": part}
+                
+                result = {
+                    "response": "".join(parts).strip(),
+                    "evidence": plan["evidence"],
+                    "tool_used": plan["tool_used"]
+                }
+                self._store_result(query_type, cache_key, result, plan)
+            
+            self._finish_turn(session_id, query_type, result)
+            yield {"event": "done", "session_id": session_id}
+            
+        except Exception as e:
+            logger.error(f"Erro ao processar consulta: {e}")
+            yield {
+                "event": "error",
+                "content": f"Desculpe, ocorreu um erro ao processar sua consulta: {str(e)}"
+            }
+    
+    def _start_turn(self, message: str, session_id: Optional[str]
+                    ) -> Tuple[str, str, str, Dict[str, Any], Tuple[str, str, str]]:
+        """
+        Registra a mensagem do usuário e classifica a consulta
+        
+        Args:
+            message: Mensagem do usuário
+            session_id: ID da sessão (opcional)
             
         Returns:
-            Tipo de consulta (rag, web, general)
+            ID da sessão, tipo de consulta, mensagem normalizada, contexto da
+            conversa e chave de cache
+        """
+        # Cria sessão se não existir
+        if session_id is None:
+            session_id = self.memory.create_session()
+        
+        # Adiciona mensagem do usuário à memória
+        self.memory.add_message(session_id, "user", message)
+        
+        # Normaliza a mensagem uma única vez para todas as etapas
+        message_lower = self._normalize_message(message)
+        
+        # Analisa o tipo de consulta
+        query_type = self._analyze_query_type(message_lower)
+        
+        # Obtém contexto da conversa
+        context = self.memory.get_context_summary(session_id)
+        
+        # O contexto enviado ao LLM entra na chave: a resposta de uma sessão só
+        # é reaproveitada por outra com o mesmo contexto
+        cache_key = (query_type, " ".join(message_lower.split()), context_text(context))
+        return session_id, query_type, message_lower, context, cache_key
+    
+    def _cached_result(self, query_type: str, cache_key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+        """Obtém resposta do cache para tipos que não dependem do histórico"""
+        if query_type not in self.CACHEABLE_QUERY_TYPES:
+            return None
+        return self._response_cache.get(cache_key)
+    
+    def _store_result(self, query_type: str, cache_key: Tuple[str, str, str],
+                      result: Dict[str, Any], plan: Dict[str, Any]):
+        """Armazena a resposta no cache"""
+        # Só armazena respostas do LLM com evidências: respostas prontas de
+        # falhas (LLM ou ferramenta) e dados do fallback da busca não ficam no cache
+        if (query_type in self.CACHEABLE_QUERY_TYPES and plan.get("generated")
+                and plan.get("cacheable", True) and result.get("evidence")):
+            self._response_cache.set(cache_key, result)
+    
+    def _finish_turn(self, session_id: str, query_type: str, result: Dict[str, Any]):
+        """Registra a resposta na memória e atualiza o contexto"""
+        # Adiciona resposta à memória
+        self.memory.add_message(
+            session_id, 
+            "assistant", 
+            result["response"],
+            tool_used=result["tool_used"],
+            evidence=result.get("evidence")
+        )
+        
+        # Atualiza contexto
+        self.memory.update_context_data(session_id, "last_query_type", query_type)
+        self.memory.update_context_data(session_id, "last_tool_used", result["tool_used"])
+    
+    @staticmethod
+    def _meta_event(session_id: str, tool_used: str, evidence: Any) -> Dict[str, Any]:
+        """Evento inicial da resposta transmitida"""
+        return {
+            "event": "meta",
+            "session_id": session_id,
+            "tool_used": tool_used,
+            "evidence": evidence
+        }
+    
+    @staticmethod
+    def _normalize_message(message: str) -> str:
         """
-        message_lower = message.lower()
+        Normaliza a mensagem para comparação com as palavras-chave
         
-        # Verifica palavras-chave RAG (dados específicos)
-        rag_score = sum(1 for keyword in self.rag_keywords if keyword in message_lower)
+        Usa NFC + casefold para que "LÍQUIDO", "Líquido" e "líquido" sejam
+        equivalentes independentemente da forma Unicode enviada pelo cliente.
+        """
+        return _normalize(message)
+    
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _analyze_query_type(cls, message_lower: str) -> str:
+        """
+        Analisa o tipo de consulta
         
-        # Verifica palavras-chave Web (legislação)
-        web_score = sum(1 for keyword in self.web_keywords if keyword in message_lower)
+        Depende apenas da mensagem e das palavras-chave da classe, então
+        mensagens repetidas reaproveitam a classificação.
         
-        # Verifica palavras-chave gerais (conversa)
-        general_score = sum(1 for keyword in self.general_keywords if keyword in message_lower)
+        Args:
+            message_lower: Mensagem do usuário já normalizada
+            
+        Returns:
+            Tipo de consulta (rag, web, hybrid, general)
+        """
+        # Tokeniza uma única vez
+        tokens = set(_TOKEN_PATTERN.findall(message_lower))
         
         # Verifica se é uma pergunta direta sobre dados específicos
-        if any(name in message_lower for name in ['ana', 'bruno', 'souza', 'lima']):
+        if not tokens.isdisjoint(cls.NAME_OVERRIDES):
             return "rag"
         
+        # Palavras simples por interseção de conjuntos; expressões em uma passada
+        scores = {category: len(tokens & words) for category, words in cls._WORD_SETS.items()}
+        for match in cls._PHRASE_PATTERN.finditer(message_lower):
+            for category in cls._PHRASE_CATEGORIES[match.group()]:
+                scores[category] += 1
+        rag_score = scores["rag"]
+        web_score = scores["web"]
+        general_score = scores["general"]
+        
         # Verifica se é uma pergunta sobre legislação
-        if any(word in message_lower for word in ['lei', 'direito', 'trabalhista', 'clt', 'fgts', 'inss', 'como calcular', 'como funciona', 'selic', 'taxa selic', 'juros', 'férias', 'ferias', 'previdência', 'previdencia']):
+        if scores["_legal"] > 0:
             return "web"
         
         # Verifica se é uma conversa geral
-        if general_score > 0 or len(message.split()) <= 3:
+        if general_score > 0 or len(message_lower.split()) <= 3:
             return "general"
         
+        # Pontuações próximas (se habilitado): a ferramenta decide
+        if (cls.HYBRID_ROUTING and rag_score > 0 and web_score > 0
+                and abs(rag_score - web_score) <= 1):
+            return "hybrid"
+        
         # Se tem palavras-chave RAG, prioriza RAG
         if rag_score > 0:
             return "rag"
@@ -157,238 +459,267 @@ class PayrollAgent:
         # Fallback: se não consegue classificar, tenta RAG primeiro
         return "rag"
     
-    async def _process_rag_query(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def _plan_reply(self, message: str, query_type: str, message_lower: str) -> Dict[str, Any]:
         """
-        Processa consulta RAG
+        Executa a ferramenta adequada e prepara a resposta
         
         Args:
             message: Mensagem do usuário
+            query_type: Tipo de consulta
+            message_lower: Mensagem já normalizada
+            
+        Returns:
+            Plano da resposta: ferramenta, evidências, prompt para o LLM
+            (None quando não há o que gerar) e resposta alternativa sem LLM
+        """
+        if query_type == "rag":
+            return await self._plan_rag_reply(message)
+        if query_type == "web":
+            return await self._plan_web_reply(message)
+        if query_type == "hybrid":
+            return await self._plan_hybrid_reply(message)
+        
+        # Conversa geral: a própria mensagem vai ao LLM (exceto cumprimentos)
+        small_talk = self._SMALL_TALK_PATTERN.fullmatch(message_lower) is not None
+        return {
+            "tool_used": "general",
+            "evidence": None,
+            "prompt": None if small_talk else message,
+            "fallback": self._fallback_reply(message_lower)
+        }
+    
+    async def _complete_reply(self, plan: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Gera a resposta completa a partir do plano
+        
+        Registra em plan["generated"] se a resposta veio do LLM.
+        
+        Args:
+            plan: Plano da resposta
             context: Contexto da conversa
             
         Returns:
             Resposta processada
         """
+        response = plan["fallback"]
+        plan["generated"] = False
+        if plan["prompt"] is not None:
+            try:
+                response = await self.llm.generate_response(plan["prompt"], context)
+                plan["generated"] = True
+            except Exception as llm_error:
+                # Resposta fluida mesmo sem LLM
+                logger.error(f"Erro no LLM: {llm_error}")
+        
+        return {
+            "response": response,
+            "evidence": plan["evidence"],
+            "tool_used": plan["tool_used"]
+        }
+    
+    async def _stream_reply(self, plan: Dict[str, Any], context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Gera a resposta a partir do plano em partes
+        
+        Registra em plan["generated"] se a resposta veio do LLM.
+        
+        Args:
+            plan: Plano da resposta
+            context: Contexto da conversa
+            
+        Yields:
+            Trechos da resposta
+        """
+        plan["generated"] = False
+        if plan["prompt"] is None:
+            yield plan["fallback"]
+            return
+        
+        started = False
+        try:
+            async for part in self.llm.generate_response_stream(plan["prompt"], context):
+                started = True
+                yield part
+            plan["generated"] = True
+        except Exception as llm_error:
+            # Depois do primeiro trecho não há como trocar a resposta
+            if started:
+                raise
+            logger.error(f"Erro no LLM: {llm_error}")
+            yield plan["fallback"]
+    
+    async def _plan_hybrid_reply(self, message: str) -> Dict[str, Any]:
+        """
+        Prepara resposta ambígua: dados da folha primeiro, depois a web
+        
+        O RAG é local e responde na hora; a busca na web (e a cota do Google)
+        só é usada quando a folha não tem dados para a consulta.
+        
+        Args:
+            message: Mensagem do usuário
+            
+        Returns:
+            Plano da resposta
+        """
         try:
-            # Executa consulta RAG
             rag_result = await self.rag.query(message)
+        except Exception as e:
+            logger.error(f"Erro no RAG: {e}")
+            rag_result = None
+        
+        if rag_result is not None and rag_result.get("success"):
+            return await self._plan_rag_reply(message, rag_result=rag_result)
+        
+        try:
+            web_result = await self.web_search.search_with_citation(message)
+        except Exception as e:
+            logger.error(f"Erro na busca web: {e}")
+            web_result = None
+        
+        if web_result is not None and web_result.get("success"):
+            return await self._plan_web_reply(message, web_result=web_result)
+        
+        # Nenhuma encontrou dados: responde com o resultado do RAG
+        return await self._plan_rag_reply(message, rag_result=rag_result)
+    
+    async def _plan_rag_reply(self, message: str,
+                              rag_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Executa consulta RAG e prepara a resposta
+        
+        Args:
+            message: Mensagem do usuário
+            rag_result: Resultado do RAG já obtido (opcional)
+            
+        Returns:
+            Plano da resposta
+        """
+        try:
+            # Executa consulta RAG
+            if rag_result is None:
+                rag_result = await self.rag.query(message)
+            
+            rag_data = rag_result["data"]
             
             if not rag_result["success"]:
                 # Usa LLM para gerar resposta mais fluida mesmo quando não encontra dados
-                rag_data = rag_result["data"]
-                llm_response = await self.llm.generate_response(
-                    f"O usuário perguntou: '{message}'. "
-                    f"Baseado nos dados disponíveis, a resposta é: '{rag_data}'. "
-                    f"Transforme isso em uma resposta conversacional e amigável.",
-                    context
-                )
                 return {
-                    "response": llm_response,
+                    "tool_used": "rag",
                     "evidence": None,
-                    "tool_used": "rag"
+                    "prompt": "\n".join((
+                        f"O usuário perguntou: '{message}'.",
+                        f"Baseado nos dados disponíveis, a resposta é: '{rag_data}'.",
+                        "Transforme isso em uma resposta conversacional e amigável."
+                    )),
+                    "fallback": self.RAG_ERROR_REPLY
                 }
             
             # Usa LLM para tornar a resposta mais fluida e conversacional
-            rag_data = rag_result["data"]
             evidence = rag_result.get("evidence", [])
+            prompt = _build_tool_prompt(
+                message, "nos dados da folha de pagamento", rag_data, evidence,
+                "Evidências encontradas", "os dados encontrados"
+            )
             
-            try:
-                # Monta contexto para o LLM
-                evidence_context = ""
-                if evidence:
-                    evidence_context = f"Evidências encontradas: {evidence}"
-                
-                llm_response = await self.llm.generate_response(
-                    f"O usuário perguntou: '{message}'. "
-                    f"Baseado nos dados da folha de pagamento, encontrei: '{rag_data}'. "
-                    f"{evidence_context} "
-                    f"Transforme isso em uma resposta conversacional, natural e amigável, "
-                    f"como se você fosse um assistente pessoal. Use os dados encontrados mas "
-                    f"seja fluido e natural na resposta.",
-                    context
-                )
-                
-                return {
-                    "response": llm_response,
-                    "evidence": evidence,
-                    "tool_used": "rag"
-                }
-            except Exception as llm_error:
-                logger.error(f"Erro no LLM: {llm_error}")
-                # Resposta fluida sem LLM
-                response = f"Perfeito! Encontrei os dados que você pediu: {rag_data} 😊"
-                if evidence:
-                    response += f" Os dados estão bem detalhados e confiáveis!"
-                response += " Precisa de mais alguma informação sobre folha de pagamento?"
-                
-                return {
-                    "response": response,
-                    "evidence": evidence,
-                    "tool_used": "rag"
-                }
+            # Resposta fluida sem LLM
+            fallback = f"Perfeito! Encontrei os dados que você pediu: {rag_data} 😊"
+            if evidence:
+                fallback += " Os dados estão bem detalhados e confiáveis!"
+            fallback += " Precisa de mais alguma informação sobre folha de pagamento?"
+            
+            return {
+                "tool_used": "rag",
+                "evidence": evidence,
+                "prompt": prompt,
+                "fallback": fallback
+            }
             
         except Exception as e:
             logger.error(f"Erro no RAG: {e}")
             return {
-                "response": f"Desculpe, não consegui consultar os dados de folha no momento. Tente novamente em alguns instantes.",
+                "tool_used": "rag",
                 "evidence": None,
-                "tool_used": "rag"
+                "prompt": None,
+                "fallback": self.RAG_ERROR_REPLY
             }
     
-    async def _process_web_query(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def _plan_web_reply(self, message: str,
+                              web_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        Processa consulta de busca na web
+        Executa busca na web e prepara a resposta
         
         Args:
             message: Mensagem do usuário
-            context: Contexto da conversa
+            web_result: Resultado da busca já obtido (opcional)
             
         Returns:
-            Resposta processada
+            Plano da resposta
         """
         try:
             # Executa busca na web
-            web_result = await self.web_search.search_with_citation(message)
+            if web_result is None:
+                web_result = await self.web_search.search_with_citation(message)
             
             if not web_result["success"]:
                 # Resposta fluida mesmo sem LLM
-                response = f"Ops! Não consegui acessar as informações na web no momento. 😊 Mas não se preocupe! Tente novamente em alguns instantes que vou buscar para você. Ou posso ajudar com outras questões sobre folha de pagamento!"
                 return {
-                    "response": response,
+                    "tool_used": "web",
                     "evidence": None,
-                    "tool_used": "web"
+                    "prompt": None,
+                    "fallback": self.WEB_UNAVAILABLE_REPLY
                 }
             
             # Usa LLM para tornar a resposta mais fluida e conversacional
             web_data = web_result["data"]
             evidence = web_result.get("evidence", [])
+            prompt = _build_tool_prompt(
+                message, "na busca na web", web_data, evidence,
+                "Fontes encontradas", "as informações encontradas"
+            )
             
-            try:
-                # Monta contexto para o LLM
-                evidence_context = ""
-                if evidence:
-                    evidence_context = f"Fontes encontradas: {evidence}"
-                
-                llm_response = await self.llm.generate_response(
-                    f"O usuário perguntou: '{message}'. "
-                    f"Baseado na busca na web, encontrei: '{web_data}'. "
-                    f"{evidence_context} "
-                    f"Transforme isso em uma resposta conversacional, natural e amigável, "
-                    f"como se você fosse um assistente pessoal. Use as informações encontradas "
-                    f"mas seja fluido e natural na resposta.",
-                    context
-                )
-                
-                return {
-                    "response": llm_response,
-                    "evidence": evidence,
-                    "tool_used": "web"
-                }
-            except Exception as llm_error:
-                logger.error(f"Erro no LLM: {llm_error}")
-                # Resposta fluida sem LLM
-                response = f"Perfeito! Encontrei informações sobre '{message}':\n\n{web_data} 😊"
-                if evidence:
-                    response += f"\n\nAs fontes estão bem detalhadas e confiáveis!"
-                response += "\n\nPrecisa de mais alguma informação sobre legislação trabalhista?"
-                
-                return {
-                    "response": response,
-                    "evidence": evidence,
-                    "tool_used": "web"
-                }
+            # Resposta fluida sem LLM
+            fallback = f"Perfeito! Encontrei informações sobre '{message}':\n\n{web_data} 😊"
+            if evidence:
+                fallback += "\n\nAs fontes estão bem detalhadas e confiáveis!"
+            fallback += "\n\nPrecisa de mais alguma informação sobre legislação trabalhista?"
+            
+            return {
+                "tool_used": "web",
+                "evidence": evidence,
+                "prompt": prompt,
+                "fallback": fallback,
+                # Dados do fallback da busca não vão ao cache de respostas
+                "cacheable": not web_result.get("fallback", False)
+            }
             
         except Exception as e:
             logger.error(f"Erro na busca web: {e}")
             return {
-                "response": f"Desculpe, não consegui buscar informações na web no momento. Tente novamente em alguns instantes.",
+                "tool_used": "web",
                 "evidence": None,
-                "tool_used": "web"
+                "prompt": None,
+                "fallback": self.WEB_ERROR_REPLY
             }
     
-    async def _process_general_query(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    def _fallback_reply(self, message_lower: str) -> str:
         """
-        Processa consulta geral
+        Escolhe a resposta pronta do primeiro grupo que casa com a mensagem
         
         Args:
-            message: Mensagem do usuário
-            context: Contexto da conversa
+            message_lower: Mensagem do usuário já normalizada
             
         Returns:
-            Resposta processada
+            Resposta pronta
         """
-        try:
-            # Gera resposta geral usando LLM
-            response = await self.llm.generate_response(message, context)
-            
-            return {
-                "response": response,
-                "evidence": None,
-                "tool_used": "general"
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro na resposta geral: {e}")
-            # Resposta fluida mesmo sem LLM
-            message_lower = message.lower()
-            
-            # Saudações
-            if any(greeting in message_lower for greeting in ['olá', 'oi', 'bom dia', 'boa tarde', 'boa noite', 'e aí', 'eae', 'como vai']):
-                response = "Olá! 😊 Estou aqui para ajudar com questões de folha de pagamento. Como posso te auxiliar hoje?"
-            
-            # Agradecimentos
-            elif any(thanks in message_lower for thanks in ['obrigado', 'obrigada', 'valeu', 'obrigad', 'brigado', 'brigada', 'valeu']):
-                response = "De nada! 😊 Fico feliz em poder ajudar. Precisa de mais alguma coisa sobre folha de pagamento?"
-            
-            # Como está
-            elif any(how in message_lower for how in ['como você está', 'como está', 'tudo bem', 'beleza', 'tranquilo', 'suave']):
-                response = "Estou ótimo, obrigado por perguntar! 😊 Pronto para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"
-            
-            # Confirmações
-            elif any(confirm in message_lower for confirm in ['ok', 'certo', 'entendi', 'perfeito', 'legal', 'bacana', 'show', 'massa', 'top']):
-                response = "Perfeito! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"
-            
-            # Despedidas
-            elif any(bye in message_lower for bye in ['tchau', 'até logo', 'até mais', 'até', 'falou', 'flw', 'abraço', 'abraços']):
-                response = "Até logo! 😊 Foi um prazer ajudar. Volte sempre que precisar de informações sobre folha de pagamento!"
-            
-            # Perguntas sobre o que pode fazer
-            elif any(what in message_lower for what in ['o que você faz', 'o que você pode', 'como você pode', 'o que consegue', 'o que sabe']):
-                response = "Posso ajudar com várias coisas! 😊 Consultar dados de folha de pagamento, buscar informações sobre legislação trabalhista, e conversar sobre qualquer assunto relacionado. O que você gostaria de saber?"
-            
-            # Perguntas sobre ajuda
-            elif any(help in message_lower for help in ['ajuda', 'help', 'pode ajudar', 'consegue ajudar', 'preciso de ajuda']):
-                response = "Claro que posso ajudar! 😊 Posso consultar dados de folha de pagamento, buscar informações sobre legislação trabalhista, e responder qualquer pergunta relacionada. O que você gostaria de saber?"
-            
-            # Perguntas sobre dúvidas
-            elif any(doubt in message_lower for doubt in ['dúvida', 'duvida', 'duvido', 'pergunta', 'questão', 'questao', 'problema']):
-                response = "Estou aqui para esclarecer suas dúvidas! 😊 Posso ajudar com questões de folha de pagamento, legislação trabalhista, ou qualquer outra pergunta. O que você gostaria de saber?"
-            
-            # Conversas sobre lembrar
-            elif any(remember in message_lower for remember in ['lembra', 'lembro', 'lembrar', 'esqueci', 'esqueceu', 'esquecer']):
-                response = "Sim, lembro! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"
-            
-            # Conversas sobre saber/conhecer
-            elif any(know in message_lower for know in ['sabia', 'sabe', 'saber', 'conhece', 'conhecer', 'conhecia']):
-                response = "Sim, sei várias coisas! 😊 Posso ajudar com dados de folha de pagamento, legislação trabalhista, e muito mais. O que você gostaria de saber?"
-            
-            # Conversas sobre poder/conseguir
-            elif any(can in message_lower for can in ['pode', 'poder', 'consegue', 'conseguir', 'quero', 'quer', 'querer', 'preciso', 'precisa', 'precisar', 'gostaria']):
-                response = "Claro que posso! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"
-            
-            # Conversas sobre falar/conversar
-            elif any(talk in message_lower for talk in ['conversa', 'falar', 'falei', 'disse', 'comentou', 'mencionou']):
-                response = "Adoro conversar! 😊 Estou aqui para ajudar com qualquer questão de folha de pagamento. O que você gostaria de saber?"
-            
-            # Resposta padrão para qualquer outra coisa
-            else:
-                response = "Entendi! 😊 Posso ajudar com consultas sobre dados de folha de pagamento, informações sobre funcionários, ou questões gerais sobre legislação trabalhista. O que você gostaria de saber?"
-            
-            return {
-                "response": response,
-                "evidence": None,
-                "tool_used": "general"
-            }
-    
+        tokens = set(_TOKEN_PATTERN.findall(message_lower))
+        matches = [self._FALLBACK_WORDS[token] for token in tokens & self._FALLBACK_WORDS.keys()]
+        matches.extend(
+            self._FALLBACK_PHRASES[match.group()]
+            for match in self._FALLBACK_PATTERN.finditer(message_lower)
+        )
+        if not matches:
+            return self.DEFAULT_FALLBACK_REPLY
+        return self.FALLBACK_REPLIES[min(matches)][1]
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Obtém estatísticas das sessões"""
@@ -401,4 +732,9 @@ class PayrollAgent:
     def cleanup_sessions(self):
         """Limpa sessões expiradas"""
         self.memory.cleanup_old_sessions()
+    
+    async def aclose(self):
+        """Libera conexões abertas pelo agente"""
+        await self.llm.aclose()
+        await self.web_search.aclose()
     
\ No newline at end of file
@@ -2,21 +2,82 @@
 Sistema de memória de conversa para o chatbot
 Implementa contexto entre turnos da conversa
 """
-import json
 import logging
-from typing import Dict, Any, List, Optional
+import re
+import time
+from collections import Counter, OrderedDict, deque
+from itertools import islice
+from typing import Deque, Dict, Any, FrozenSet, List, Optional, Tuple
 from datetime import datetime, timedelta
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 import uuid
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+# Termos detectados no resumo de contexto: (campo do resumo, valor, padrão)
+_SUMMARY_TERMS = (
+    ("topics_discussed", "salário", r"sal[áa]rio"),
+    ("topics_discussed", "descontos", r"desconto"),
+    ("topics_discussed", "INSS", r"inss"),
+    ("topics_discussed", "IRRF", r"irrf"),
+    ("topics_discussed", "bônus", r"b[ôo]nus"),
+    ("topics_discussed", "trimestre", r"trimestre"),
+    ("employee_mentions", "Ana Souza", r"ana souza"),
+    ("employee_mentions", "Bruno Lima", r"bruno lima"),
+    ("competencies_mentioned", "2025-01", r"2025-01|janeiro"),
+    ("competencies_mentioned", "2025-02", r"2025-02|fevereiro"),
+    ("competencies_mentioned", "2025-03", r"2025-03|março"),
+    ("competencies_mentioned", "2025-04", r"2025-04|abril"),
+    ("competencies_mentioned", "2025-05", r"2025-05|maio"),
+    ("competencies_mentioned", "2025-06", r"2025-06|junho"),
+)
+
+# Um grupo nomeado por termo: uma única passada por mensagem
+_SUMMARY_PATTERN = re.compile("|".join(
+    f"(?P<t{index}>{pattern})" for index, (_, _, pattern) in enumerate(_SUMMARY_TERMS)
+))
+
+# Campo e valor do resumo de cada grupo do padrão
+_SUMMARY_GROUPS = {
+    f"t{index}": (key, value) for index, (key, value, _) in enumerate(_SUMMARY_TERMS)
+}
+
+def _message_terms(message: 'Message') -> FrozenSet[Tuple[str, str]]:
+    """
+    Extrai os itens de resumo de uma mensagem
+    
+    Args:
+        message: Mensagem da conversa
+        
+    Returns:
+        Pares (campo do resumo, valor) encontrados na mensagem
+    """
+    terms = {
+        _SUMMARY_GROUPS[match.lastgroup]
+        for match in _SUMMARY_PATTERN.finditer(message.content.lower())
+    }
+    if message.tool_used:
+        terms.add(("tools_used", message.tool_used))
+    return frozenset(terms)
+
+def _orjson_default(obj: Any) -> Any:
+    """Serializa tipos não suportados nativamente pelo orjson"""
+    if isinstance(obj, deque):
+        return list(obj)
+    return str(obj)
+
+def _encode(obj: Any) -> bytes:
+    """Serializa para JSON com orjson"""
+    return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
 @dataclass
 class Message:
     """Representa uma mensagem na conversa"""
     role: str  # "user" ou "assistant"
     content: str
-    timestamp: datetime
+    timestamp: float  # Epoch em segundos; datetime só é criado na exportação
     tool_used: Optional[str] = None
     evidence: Optional[Dict[str, Any]] = None
     
@@ -25,7 +86,7 @@ class Message:
         return {
             "role": self.role,
             "content": self.content,
-            "timestamp": self.timestamp.isoformat(),
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
             "tool_used": self.tool_used,
             "evidence": self.evidence
         }
@@ -36,7 +97,7 @@ class Message:
         return cls(
             role=data["role"],
             content=data["content"],
-            timestamp=datetime.fromisoformat(data["timestamp"]),
+            timestamp=datetime.fromisoformat(data["timestamp"]).timestamp(),
             tool_used=data.get("tool_used"),
             evidence=data.get("evidence")
         )
@@ -45,10 +106,13 @@ class Message:
 class ConversationContext:
     """Representa o contexto de uma conversa"""
     session_id: str
-    messages: List[Message]
+    messages: Deque[Message]
     context_data: Dict[str, Any]
     last_activity: datetime
     created_at: datetime
+    # Itens de resumo de cada mensagem e contagem acumulada das mensagens retidas
+    message_terms: Deque[FrozenSet[Tuple[str, str]]] = field(default_factory=deque, repr=False, compare=False)
+    term_counts: Counter = field(default_factory=Counter, repr=False, compare=False)
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte para dicionário"""
@@ -65,7 +129,7 @@ class ConversationContext:
         """Cria a partir de dicionário"""
         return cls(
             session_id=data["session_id"],
-            messages=[Message.from_dict(msg) for msg in data["messages"]],
+            messages=deque(Message.from_dict(msg) for msg in data["messages"]),
             context_data=data.get("context_data", {}),
             last_activity=datetime.fromisoformat(data["last_activity"]),
             created_at=datetime.fromisoformat(data["created_at"])
@@ -84,7 +148,8 @@ class ConversationMemory:
         """
         self.max_sessions = max_sessions
         self.max_messages_per_session = max_messages_per_session
-        self.sessions: Dict[str, ConversationContext] = {}
+        # Mantido em ordem de última atividade (mais antiga primeiro)
+        self.sessions: "OrderedDict[str, ConversationContext]" = OrderedDict()
         self.session_timeout = timedelta(hours=24)  # 24 horas de inatividade
     
     def create_session(self, session_id: Optional[str] = None) -> str:
@@ -106,13 +171,15 @@ class ConversationMemory:
         # Cria nova sessão
         context = ConversationContext(
             session_id=session_id,
-            messages=[],
+            messages=deque(maxlen=self.max_messages_per_session),
+            message_terms=deque(maxlen=self.max_messages_per_session),
             context_data={},
             last_activity=datetime.now(),
             created_at=datetime.now()
         )
         
         self.sessions[session_id] = context
+        self.sessions.move_to_end(session_id)
         logger.info(f"Nova sessão criada: {session_id}")
         
         return session_id
@@ -140,23 +207,36 @@ class ConversationMemory:
         message = Message(
             role=role,
             content=content,
-            timestamp=datetime.now(),
+            timestamp=time.time(),
             tool_used=tool_used,
             evidence=evidence
         )
         
-        # Adiciona à sessão
+        # Adiciona à sessão (o deque descarta a mensagem mais antiga ao atingir o limite)
         session = self.sessions[session_id]
-        session.messages.append(message)
-        session.last_activity = datetime.now()
-        
-        # Limita número de mensagens
-        if len(session.messages) > self.max_messages_per_session:
-            session.messages = session.messages[-self.max_messages_per_session:]
+        self._append_message(session, message)
+        self._touch(session)
         
         logger.debug(f"Mensagem adicionada à sessão {session_id}")
         return True
     
+    def _append_message(self, session: ConversationContext, message: Message):
+        """
+        Anexa mensagem à sessão mantendo as contagens do resumo sincronizadas
+        
+        Args:
+            session: Sessão de destino
+            message: Mensagem a anexar
+        """
+        # O deque descartará a mensagem mais antiga: desconta seus itens do resumo
+        if len(session.message_terms) == session.message_terms.maxlen:
+            session.term_counts.subtract(session.message_terms[0])
+        
+        terms = _message_terms(message)
+        session.messages.append(message)
+        session.message_terms.append(terms)
+        session.term_counts.update(terms)
+    
     def get_conversation_history(self, session_id: str, max_messages: int = 10) -> List[Message]:
         """
         Obtém histórico da conversa
@@ -172,9 +252,9 @@ class ConversationMemory:
             return []
         
         session = self.sessions[session_id]
-        messages = session.messages[-max_messages:] if max_messages > 0 else session.messages
+        start = max(len(session.messages) - max_messages, 0) if max_messages > 0 else 0
         
-        return messages
+        return list(islice(session.messages, start, None))
     
     def get_context_summary(self, session_id: str) -> Dict[str, Any]:
         """
@@ -203,58 +283,10 @@ class ConversationMemory:
             "competencies_mentioned": []
         }
         
-        # Analisa ferramentas utilizadas
-        tools_used = set()
-        for message in session.messages:
-            if message.tool_used:
-                tools_used.add(message.tool_used)
-        context_summary["tools_used"] = list(tools_used)
-        
-        # Analisa tópicos discutidos
-        topics = set()
-        for message in session.messages:
-            content_lower = message.content.lower()
-            if "salário" in content_lower or "salario" in content_lower:
-                topics.add("salário")
-            if "desconto" in content_lower:
-                topics.add("descontos")
-            if "inss" in content_lower:
-                topics.add("INSS")
-            if "irrf" in content_lower:
-                topics.add("IRRF")
-            if "bônus" in content_lower or "bonus" in content_lower:
-                topics.add("bônus")
-            if "trimestre" in content_lower:
-                topics.add("trimestre")
-        context_summary["topics_discussed"] = list(topics)
-        
-        # Analisa menções de funcionários
-        employees = set()
-        for message in session.messages:
-            content = message.content
-            if "Ana Souza" in content:
-                employees.add("Ana Souza")
-            if "Bruno Lima" in content:
-                employees.add("Bruno Lima")
-        context_summary["employee_mentions"] = list(employees)
-        
-        # Analisa competências mencionadas
-        competencies = set()
-        for message in session.messages:
-            content = message.content
-            if "2025-01" in content or "janeiro" in content.lower():
-                competencies.add("2025-01")
-            if "2025-02" in content or "fevereiro" in content.lower():
-                competencies.add("2025-02")
-            if "2025-03" in content or "março" in content.lower():
-                competencies.add("2025-03")
-            if "2025-04" in content or "abril" in content.lower():
-                competencies.add("2025-04")
-            if "2025-05" in content or "maio" in content.lower():
-                competencies.add("2025-05")
-            if "2025-06" in content or "junho" in content.lower():
-                competencies.add("2025-06")
-        context_summary["competencies_mentioned"] = list(competencies)
+        # Contagens mantidas em add_message: apenas monta as listas
+        for (key, value), count in session.term_counts.items():
+            if count > 0:
+                context_summary[key].append(value)
         
         return context_summary
     
@@ -275,7 +307,7 @@ class ConversationMemory:
         
         session = self.sessions[session_id]
         session.context_data[key] = value
-        session.last_activity = datetime.now()
+        self._touch(session)
         
         return True
     
@@ -297,35 +329,28 @@ class ConversationMemory:
         session = self.sessions[session_id]
         return session.context_data.get(key, default)
     
+    def _touch(self, session: ConversationContext):
+        """Registra atividade na sessão e a move para o fim da ordem de atividade"""
+        session.last_activity = datetime.now()
+        self.sessions.move_to_end(session.session_id)
+    
     def _cleanup_expired_sessions(self):
         """Remove sessões expiradas"""
         now = datetime.now()
-        expired_sessions = []
-        
-        for session_id, session in self.sessions.items():
-            if now - session.last_activity > self.session_timeout:
-                expired_sessions.append(session_id)
         
-        for session_id in expired_sessions:
+        # As sessões estão em ordem de atividade: basta remover do início
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_activity <= self.session_timeout:
+                break
             del self.sessions[session_id]
             logger.info(f"Sessão expirada removida: {session_id}")
     
     def cleanup_old_sessions(self):
         """Remove sessões mais antigas se exceder o limite"""
-        if len(self.sessions) <= self.max_sessions:
-            return
-        
-        # Ordena por última atividade
-        sorted_sessions = sorted(
-            self.sessions.items(),
-            key=lambda x: x[1].last_activity
-        )
-        
-        # Remove as mais antigas
-        sessions_to_remove = len(self.sessions) - self.max_sessions
-        for i in range(sessions_to_remove):
-            session_id = sorted_sessions[i][0]
-            del self.sessions[session_id]
+        # As mais antigas estão no início da ordem de atividade
+        while len(self.sessions) > self.max_sessions:
+            session_id, _ = self.sessions.popitem(last=False)
             logger.info(f"Sessão antiga removida: {session_id}")
     
     def get_session_stats(self) -> Dict[str, Any]:
@@ -364,6 +389,42 @@ class ConversationMemory:
         session = self.sessions[session_id]
         return session.to_dict()
     
+    def export_session_bytes(self, session_id: str) -> Optional[bytes]:
+        """
+        Exporta a sessão diretamente para JSON
+        
+        O documento é o mesmo de export_session, serializado só quando pedido.
+        
+        Args:
+            session_id: ID da sessão
+            
+        Returns:
+            JSON da sessão ou None se não encontrada
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        
+        return _encode(session.to_dict())
+    
+    def import_session_bytes(self, data: bytes) -> bool:
+        """
+        Importa sessão a partir do JSON gerado por export_session_bytes
+        
+        Args:
+            data: JSON da sessão
+            
+        Returns:
+            True se importado com sucesso
+        """
+        try:
+            session_data = orjson.loads(data)
+        except orjson.JSONDecodeError as e:
+            logger.error(f"Erro ao importar sessão: {e}")
+            return False
+        
+        return self.import_session(session_data)
+    
     def import_session(self, session_data: Dict[str, Any]) -> bool:
         """
         Importa dados da sessão
@@ -376,7 +437,17 @@ class ConversationMemory:
         """
         try:
             session = ConversationContext.from_dict(session_data)
+            messages = session.messages
+            session.messages = deque(maxlen=self.max_messages_per_session)
+            session.message_terms = deque(maxlen=self.max_messages_per_session)
+            for message in messages:
+                self._append_message(session, message)
             self.sessions[session.session_id] = session
+            
+            # A sessão importada pode ser mais antiga que as atuais: reordena
+            self.sessions = OrderedDict(
+                sorted(self.sessions.items(), key=lambda x: x[1].last_activity)
+            )
             logger.info(f"Sessão importada: {session.session_id}")
             return True
         except Exception as e:
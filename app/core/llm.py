@@ -2,16 +2,166 @@
 Configuração do LLM (modelo, chaves, etc.)
 """
 import os
+import asyncio
+import hashlib
+from functools import cached_property, lru_cache
 from openai import AsyncOpenAI
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple
 import logging
+import httpx
+import orjson
 from dotenv import load_dotenv
 
+from ..utils.cache import TTLCache
+
+# Transporte aiohttp do SDK (opcional: pip install "openai[aiohttp]"); mais
+# estável que o httpx padrão sob muitas requisições concorrentes. O cliente
+# precisa de aiohttp e de httpx_aiohttp; sem um deles, DefaultAioHttpClient()
+# levanta RuntimeError na criação
+try:
+    import aiohttp  # noqa: F401
+    import httpx_aiohttp  # noqa: F401
+    from openai import DefaultAioHttpClient
+except ImportError:
+    DefaultAioHttpClient = None
+
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Campos do resumo de contexto repassados ao modelo (rótulo, chave)
+_CONTEXT_FIELDS = (
+    ("Funcionários mencionados", "employee_mentions"),
+    ("Tópicos discutidos", "topics_discussed"),
+    ("Competências mencionadas", "competencies_mentioned"),
+    ("Ferramentas utilizadas", "tools_used"),
+)
+
+# Prompt do sistema do chatbot de folha de pagamento. Não interpolar valores
+# variáveis (datas, nomes): ele é o prefixo estável de todas as chamadas
+_SYSTEM_PROMPT = """Você é um assistente especializado em folha de pagamento, mas com personalidade conversacional e amigável. Suas características são:
+
+PERSONALIDADE:
+- Seja sempre conversacional, natural e amigável
+- Use linguagem coloquial quando apropriado
+- Demonstre interesse genuíno em ajudar
+- Seja proativo em oferecer ajuda adicional
+- Use expressões como "Claro!", "Perfeito!", "Entendi!", "Ótima pergunta!"
+
+FUNCIONALIDADES:
+1. Responder perguntas sobre dados de folha de pagamento com base em informações fornecidas
+2. Buscar informações na web quando necessário para questões gerais sobre legislação trabalhista
+3. Sempre fornecer evidências claras das suas respostas
+4. Formatar valores monetários em Real (R$) brasileiro
+5. Ser preciso e confiável nas informações
+
+ESTILO DE RESPOSTA:
+- Seja fluido e natural, como se estivesse conversando com um colega
+- Use os dados encontrados mas apresente de forma conversacional
+- Adicione comentários úteis e insights quando relevante
+- Sempre termine oferecendo ajuda adicional
+- Use emojis ocasionalmente para tornar mais amigável
+
+EXEMPLOS DE TOM:
+❌ "Ana Souza recebeu R$ 8.418,75 em 2025-05"
+✅ "Perfeito! Encontrei os dados da Ana Souza para maio de 2025. Ela recebeu R$ 8.418,75 líquido. Os dados estão bem detalhados! 😊 Precisa de mais alguma informação sobre ela?"
+
+❌ "Não foi possível realizar a busca na web"
+✅ "Ops, não consegui acessar as informações na web no momento. Mas não se preocupe! Tente novamente em alguns instantes que vou buscar para você. 😊"
+
+Sempre seja claro sobre qual fonte de informação você está usando, mas de forma natural e conversacional."""
+
+# Mensagem de sistema compartilhada por todas as chamadas (somente leitura)
+_SYSTEM_MESSAGE = {"role": "system", "content": _SYSTEM_PROMPT}
+
+def _httpx_client() -> httpx.AsyncClient:
+    """
+    Cliente httpx com pool dimensionado para muitas requisições concorrentes
+    
+    Os limites podem ser ajustados por variáveis de ambiente conforme o
+    limite de taxa da conta na OpenAI. Por padrão o pool tem o tamanho do
+    semáforo de LLMConfig: conexões além dele nunca seriam usadas.
+    """
+    concurrency = os.getenv("OPENAI_MAX_CONCURRENCY", "50")
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", concurrency)),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", concurrency)),
+        keepalive_expiry=30.0
+    )
+    timeout = httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "120")), connect=10.0)
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+# Clientes compartilhados por chave de API: um único pool de conexões por processo
+_async_clients: Dict[str, AsyncOpenAI] = {}
+
+def _get_async_client(api_key: str) -> AsyncOpenAI:
+    """
+    Obtém o cliente da OpenAI para a chave, criando-o na primeira chamada
+    
+    Args:
+        api_key: Chave da API
+        
+    Returns:
+        Cliente compartilhado
+    """
+    client = _async_clients.get(api_key)
+    if client is None:
+        # O SDK já repete 429/5xx com backoff exponencial e jitter
+        max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        if DefaultAioHttpClient is not None:
+            http_client = DefaultAioHttpClient()
+        else:
+            http_client = _httpx_client()
+        client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=max_retries)
+        _async_clients[api_key] = client
+    return client
+
+async def aclose_clients():
+    """
+    Fecha e descarta todos os clientes compartilhados
+    
+    Chamada uma única vez ao encerrar a aplicação: os clientes são do
+    processo, não de uma instância de LLMConfig.
+    """
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.close()
+
+@lru_cache(maxsize=256)
+def _format_context(values: Tuple[Tuple[str, ...], ...]) -> str:
+    """
+    Formata o contexto da conversa para o prompt
+    
+    Args:
+        values: Valores de cada campo de _CONTEXT_FIELDS, já ordenados
+        
+    Returns:
+        Texto do contexto (vazio se não houver informações)
+    """
+    lines = [
+        f"{label}: {', '.join(items)}"
+        for (label, _), items in zip(_CONTEXT_FIELDS, values)
+        if items
+    ]
+    if not lines:
+        return ""
+    return "Contexto da conversa:\n" + "\n".join(lines)
+
+def context_text(context: Dict[str, Any]) -> str:
+    """
+    Obtém o texto do contexto, reaproveitando o resultado entre turnos
+    
+    Usa apenas os campos estáveis do resumo (sem timestamps ou contadores),
+    então turnos sem novidades na conversa não refazem os joins.
+    """
+    values = tuple(
+        tuple(sorted(str(item) for item in (context.get(key) or ())))
+        for _, key in _CONTEXT_FIELDS
+    )
+    return _format_context(values)
+
 class LLMConfig:
     """Configuração e gerenciamento do LLM"""
     
@@ -23,7 +173,62 @@ class LLMConfig:
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
         
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        # Respostas para chamadas idênticas (modelo, temperatura e mensagens)
+        self._response_cache = TTLCache(maxsize=512, ttl=3600)
+        
+        # Chamadas em andamento por chave: pedidos simultâneos iguais aguardam a mesma
+        self._inflight: Dict[bytes, "asyncio.Task[str]"] = {}
+        
+        # Limita chamadas simultâneas à API (ajuste conforme o limite de RPM da conta)
+        self._semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "50")))
+    
+    @cached_property
+    def client(self) -> AsyncOpenAI:
+        """Cliente da OpenAI, obtido apenas na primeira chamada ao modelo"""
+        return _get_async_client(self.api_key)
+    
+    async def aclose(self):
+        """
+        Descarta a referência ao cliente compartilhado
+        
+        O cliente continua aberto para as demais instâncias; quem o fecha é
+        aclose_clients, ao encerrar a aplicação.
+        """
+        self.__dict__.pop("client", None)
+    
+    def _build_messages(self, message: str, context: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Monta as mensagens enviadas ao modelo
+        
+        Args:
+            message: Mensagem do usuário
+            context: Contexto da conversa (opcional)
+        
+        Returns:
+            Lista de mensagens do chat
+        """
+        # O prompt do sistema vem sempre primeiro e idêntico byte a byte, e o que
+        # varia (contexto, mensagem) vem depois: o prefixo comum é o que o cache
+        # de prompts da OpenAI reaproveita entre requisições
+        messages = [
+            _SYSTEM_MESSAGE,
+            {"role": "user", "content": message}
+        ]
+        
+        # Adiciona contexto se disponível
+        if context:
+            text = context_text(context)
+            if text:
+                messages.insert(-1, {"role": "system", "content": text})
+        
+        return messages
+    
+    def _cache_key(self, messages: List[Dict[str, str]]) -> bytes:
+        """Chave do cache de respostas para modelo, temperatura e mensagens"""
+        return hashlib.blake2b(
+            orjson.dumps([self.model, self.temperature, messages]),
+            digest_size=16
+        ).digest()
     
     async def generate_response(
         self, 
@@ -42,61 +247,99 @@ class LLMConfig:
         """
         try:
             # Monta mensagens para o chat
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": message}
-            ]
+            messages = self._build_messages(message, context)
+            
+            # Evita repetir a chamada à API para o mesmo prompt
+            cache_key = self._cache_key(messages)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            # Adiciona contexto se disponível
-            if context:
-                context_text = f"Contexto da conversa: {context}"
-                messages.insert(-1, {"role": "system", "content": context_text})
+            task = self._inflight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(self._complete(messages, cache_key))
+                self._inflight[cache_key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
             
+            # shield: o cancelamento de um pedido não interrompe os demais
+            return await asyncio.shield(task)
+        
+        except Exception as e:
+            logger.error(f"Erro ao gerar resposta do LLM: {e}")
+            raise
+    
+    async def _complete(self, messages: List[Dict[str, str]], cache_key: bytes) -> str:
+        """
+        Chama o modelo e armazena a resposta no cache
+        
+        Args:
+            messages: Mensagens do chat
+            cache_key: Chave do cache de respostas
+        
+        Returns:
+            Resposta gerada pelo LLM
+        """
+        async with self._semaphore:
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=self.temperature
             )
-            
-            return response.choices[0].message.content.strip()
+        
+        content = response.choices[0].message.content.strip()
+        self._response_cache.set(cache_key, content)
+        return content
+    
+    async def generate_response_stream(
+        self, 
+        message: str, 
+        context: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Gera resposta do LLM em partes, à medida que os tokens chegam
+        
+        Args:
+            message: Mensagem do usuário
+            context: Contexto da conversa (opcional)
+        
+        Yields:
+            Trechos da resposta gerada pelo LLM
+        """
+        messages = self._build_messages(message, context)
+        cache_key = self._cache_key(messages)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        try:
+            # A vaga fica ocupada enquanto a resposta é transmitida
+            async with self._semaphore:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    stream=True
+                )
+                
+                parts = []
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
         
         except Exception as e:
             logger.error(f"Erro ao gerar resposta do LLM: {e}")
             raise
-    
+        
+        # Só armazena respostas completas
+        self._response_cache.set(cache_key, "".join(parts).strip())
     
     def get_system_prompt(self) -> str:
         """
         Retorna o prompt do sistema para o chatbot de folha de pagamento
         """
-        return """Você é um assistente especializado em folha de pagamento, mas com personalidade conversacional e amigável. Suas características são:
-
-PERSONALIDADE:
-- Seja sempre conversacional, natural e amigável
-- Use linguagem coloquial quando apropriado
-- Demonstre interesse genuíno em ajudar
-- Seja proativo em oferecer ajuda adicional
-- Use expressões como "Claro!", "Perfeito!", "Entendi!", "Ótima pergunta!"
-
-FUNCIONALIDADES:
-1. Responder perguntas sobre dados de folha de pagamento com base em informações fornecidas
-2. Buscar informações na web quando necessário para questões gerais sobre legislação trabalhista
-3. Sempre fornecer evidências claras das suas respostas
-4. Formatar valores monetários em Real (R$) brasileiro
-5. Ser preciso e confiável nas informações
-
-ESTILO DE RESPOSTA:
-- Seja fluido e natural, como se estivesse conversando com um colega
-- Use os dados encontrados mas apresente de forma conversacional
-- Adicione comentários úteis e insights quando relevante
-- Sempre termine oferecendo ajuda adicional
-- Use emojis ocasionalmente para tornar mais amigável
-
-EXEMPLOS DE TOM:
-❌ "Ana Souza recebeu R$ 8.418,75 em 2025-05"
-✅ "Perfeito! Encontrei os dados da Ana Souza para maio de 2025. Ela recebeu R$ 8.418,75 líquido. Os dados estão bem detalhados! 😊 Precisa de mais alguma informação sobre ela?"
-
-❌ "Não foi possível realizar a busca na web"
-✅ "Ops, não consegui acessar as informações na web no momento. Mas não se preocupe! Tente novamente em alguns instantes que vou buscar para você. 😊"
-
-Sempre seja claro sobre qual fonte de informação você está usando, mas de forma natural e conversacional."""
+        return _SYSTEM_PROMPT
@@ -3,13 +3,17 @@ Aplicação principal do chatbot de folha de pagamento
 FastAPI com endpoints para chat, health check e documentação
 """
 import logging
+from typing import Any, AsyncIterator, Dict
+import orjson
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
 from datetime import datetime
 
 from .core.agent import PayrollAgent
+from .core.llm import aclose_clients
 from .utils.models import ChatRequest, ChatResponse, HealthCheck
 
 # Configuração de logging
@@ -35,6 +39,8 @@ async def lifespan(app: FastAPI):
     logger.info("Finalizando aplicação...")
     if agent:
         agent.cleanup_sessions()
+        await agent.aclose()
+    await aclose_clients()
     logger.info("Aplicação finalizada")
 
 # Criação da aplicação FastAPI
@@ -54,12 +60,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class StreamSafeGZipMiddleware(GZipMiddleware):
+    """
+    GZip para as respostas comuns, sem passar pelas rotas de streaming
+    
+    Versões do Starlette aceitas pelo requirements.txt ainda comprimem
+    text/event-stream e acumulam os eventos no buffer do gzip; as rotas
+    /stream vão direto para a aplicação para que os tokens cheguem na hora.
+    """
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compressão das respostas com evidências (exceto as transmitidas via SSE)
+app.add_middleware(StreamSafeGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Exemplos fixos: o corpo JSON é montado uma única vez
+EXAMPLES = {
+    "rag_examples": [
+        "Qual é o salário do Ana Souza?",
+        "Quanto recebi em maio/2025? (Ana Souza)",
+        "Qual o total líquido de Ana Souza no 1º trimestre de 2025?",
+        "Qual foi o desconto de INSS do Bruno em junho/2025?",
+        "Quando foi pago o salário de abril/2025 do Bruno e qual o líquido?",
+        "Qual foi o maior bônus do Bruno e em que mês?"
+    ],
+    "web_examples": [
+        "Traga a taxa Selic atual e cite a fonte",
+        "Como calcular férias proporcionais?",
+        "Qual é o valor do FGTS?",
+        "Como funciona o 13º salário?",
+        "Quais são os direitos trabalhistas?"
+    ],
+    "general_examples": [
+        "Olá, como você está?",
+        "Obrigado pela ajuda",
+        "Preciso de mais informações"
+    ]
+}
+_EXAMPLES_BODY = orjson.dumps(EXAMPLES)
+
+class OrjsonResponse(JSONResponse):
+    """JSONResponse serializada com orjson (rotas sem response_model)"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+
 def get_agent() -> PayrollAgent:
     """Dependency para obter o agente"""
     if agent is None:
         raise HTTPException(status_code=503, detail="Agente não inicializado")
     return agent
 
+async def _sse_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Formata eventos do agente como Server-Sent Events"""
+    async for event in events:
+        yield b"data: " + orjson.dumps(
+            event, default=str, option=orjson.OPT_SERIALIZE_NUMPY
+        ) + b"\n\n"
+
 @app.get("/", response_model=dict)
 async def root():
     """Endpoint raiz"""
@@ -87,7 +149,6 @@ async def health_check(agent: PayrollAgent = Depends(get_agent)):
         
         return HealthCheck(
             status="healthy",
-            timestamp=datetime.now(),
             version="1.0.0",
             uptime=None,
             dependencies=dependencies
@@ -97,7 +158,6 @@ async def health_check(agent: PayrollAgent = Depends(get_agent)):
         logger.error(f"Erro no health check: {e}")
         return HealthCheck(
             status="unhealthy",
-            timestamp=datetime.now(),
             version="1.0.0",
             uptime=None,
             dependencies={"error": str(e)}
@@ -131,6 +191,31 @@ async def chat(request: ChatRequest, agent: PayrollAgent = Depends(get_agent)):
             detail=f"Erro interno: {str(e)}"
         )
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, agent: PayrollAgent = Depends(get_agent)):
+    """
+    Endpoint de chat com resposta transmitida (Server-Sent Events)
+    
+    Envia ferramenta e evidências assim que disponíveis e, em seguida,
+    os trechos da resposta à medida que o LLM os gera.
+    """
+    return StreamingResponse(
+        _sse_events(agent.process_query_stream(request.message)),
+        media_type="text/event-stream"
+    )
+
+@app.post("/chat/{session_id}/stream")
+async def chat_stream_with_session(
+    session_id: str, 
+    request: ChatRequest, 
+    agent: PayrollAgent = Depends(get_agent)
+):
+    """Endpoint de chat transmitido com sessão específica"""
+    return StreamingResponse(
+        _sse_events(agent.process_query_stream(request.message, session_id)),
+        media_type="text/event-stream"
+    )
+
 @app.post("/chat/{session_id}", response_model=ChatResponse)
 async def chat_with_session(
     session_id: str, 
@@ -162,7 +247,7 @@ async def chat_with_session(
             detail=f"Erro interno: {str(e)}"
         )
 
-@app.get("/sessions/{session_id}/context")
+@app.get("/sessions/{session_id}/context", response_class=OrjsonResponse)
 async def get_session_context(session_id: str, agent: PayrollAgent = Depends(get_agent)):
     """Obtém contexto de uma sessão específica"""
     try:
@@ -176,7 +261,7 @@ async def get_session_context(session_id: str, agent: PayrollAgent = Depends(get
             detail=f"Erro interno: {str(e)}"
         )
 
-@app.get("/sessions/stats")
+@app.get("/sessions/stats", response_class=OrjsonResponse)
 async def get_sessions_stats(agent: PayrollAgent = Depends(get_agent)):
     """Obtém estatísticas das sessões"""
     try:
@@ -190,7 +275,7 @@ async def get_sessions_stats(agent: PayrollAgent = Depends(get_agent)):
             detail=f"Erro interno: {str(e)}"
         )
 
-@app.delete("/sessions/{session_id}")
+@app.delete("/sessions/{session_id}", response_class=OrjsonResponse)
 async def delete_session(session_id: str, agent: PayrollAgent = Depends(get_agent)):
     """Remove uma sessão específica"""
     try:
@@ -207,33 +292,12 @@ async def delete_session(session_id: str, agent: PayrollAgent = Depends(get_agen
 @app.get("/examples")
 async def get_examples():
     """Retorna exemplos de consultas"""
-    return {
-        "rag_examples": [
-            "Qual é o salário do Ana Souza?",
-            "Quanto recebi em maio/2025? (Ana Souza)",
-            "Qual o total líquido de Ana Souza no 1º trimestre de 2025?",
-            "Qual foi o desconto de INSS do Bruno em junho/2025?",
-            "Quando foi pago o salário de abril/2025 do Bruno e qual o líquido?",
-            "Qual foi o maior bônus do Bruno e em que mês?"
-        ],
-        "web_examples": [
-            "Traga a taxa Selic atual e cite a fonte",
-            "Como calcular férias proporcionais?",
-            "Qual é o valor do FGTS?",
-            "Como funciona o 13º salário?",
-            "Quais são os direitos trabalhistas?"
-        ],
-        "general_examples": [
-            "Olá, como você está?",
-            "Obrigado pela ajuda",
-            "Preciso de mais informações"
-        ]
-    }
+    return Response(content=_EXAMPLES_BODY, media_type="application/json")
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     """Handler para exceções HTTP"""
-    return JSONResponse(
+    return OrjsonResponse(
         status_code=exc.status_code,
         content={
             "error": exc.detail,
@@ -246,7 +310,7 @@ async def http_exception_handler(request, exc):
 async def general_exception_handler(request, exc):
     """Handler para exceções gerais"""
     logger.error(f"Erro não tratado: {exc}")
-    return JSONResponse(
+    return OrjsonResponse(
         status_code=500,
         content={
             "error": "Erro interno do servidor",
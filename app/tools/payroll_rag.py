@@ -1,127 +1,229 @@
 """
 Sistema RAG para consultas de folha de pagamento
 """
+import os
+import numpy as np
 import pandas as pd
 import logging
-from typing import Dict, Any, Optional, List
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 import re
 
+from ..utils.cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
+# Colunas de texto com poucos valores distintos: comparações viram códigos inteiros
+_CATEGORY_COLUMNS = {'name': 'category', 'competency': 'category'}
+
+# Nomes e abreviações de meses (minúsculos) -> número do mês
+_MONTH_NUMBERS = {
+    'janeiro': '01', 'jan': '01',
+    'fevereiro': '02', 'fev': '02',
+    'março': '03', 'mar': '03',
+    'abril': '04', 'abr': '04',
+    'maio': '05', 'mai': '05',
+    'junho': '06', 'jun': '06',
+    'julho': '07', 'jul': '07',
+    'agosto': '08', 'ago': '08',
+    'setembro': '09', 'set': '09',
+    'outubro': '10', 'out': '10',
+    'novembro': '11', 'nov': '11',
+    'dezembro': '12', 'dez': '12'
+}
+
+# Padrões de data compilados uma vez; o mês aceita ponto (jan.) e o ano
+# colado ("maio 2025", "mai/2025" pega o ano em _YEAR_PATTERN)
+_MONTH_PATTERN = re.compile(
+    r'\b(' + '|'.join(sorted(_MONTH_NUMBERS, key=len, reverse=True)) + r')\.?(?![^\W\d_])\s*(\d{4}\b)?'
+)
+_YEAR_PATTERN = re.compile(r'\b(\d{4})\b')
+_YEAR_MONTH_PATTERN = re.compile(r'\b(\d{4}-\d{2})\b')  # 2025-01
+_MONTH_YEAR_PATTERN = re.compile(r'\b(\d{2})/(\d{4})\b')  # 01/2025
+
+# Funcionários conhecidos: grupo do padrão -> nome canônico
+_EMPLOYEE_NAMES = {'ana': 'Ana Souza', 'bruno': 'Bruno Lima'}
+_EMPLOYEE_NAME_PATTERN = re.compile(
+    r'\b(?:(?P<ana>ana(?:\s+souza)?|souza)|(?P<bruno>bruno(?:\s+lima)?|lima))\b'
+)
+
+# Classificação da consulta em uma passada; a prioridade entre os grupos é a
+# ordem de _QUERY_TYPE_PRIORITY (funcionário > agregado > competência)
+_QUERY_TYPE_PRIORITY = ("specific_employee", "aggregate", "competency")
+_QUERY_TYPE_PATTERN = re.compile(
+    r'\b(?:'
+    r'(?P<specific_employee>ana|bruno|souza|lima)'
+    r'|(?P<aggregate>total|médias?|médios?|soma|somar|somatório|trimestre|semestre)'
+    r'|(?P<competency>' + '|'.join(name for name in _MONTH_NUMBERS if len(name) > 3) + r')'
+    r')\b'
+)
+
+# Troca separadores do formato americano (1,234.56) para o brasileiro (1.234,56)
+_BRL_TRANS = str.maketrans({',': '.', '.': ','})
+
+@lru_cache(maxsize=1024)
+def _format_brl(value: float) -> str:
+    """Formata valor como moeda brasileira (valores se repetem entre consultas)"""
+    return f"R$ {value:,.2f}".translate(_BRL_TRANS)
+
+@lru_cache(maxsize=4)
+def _read_payroll_csv(csv_path: str, mtime: float) -> pd.DataFrame:
+    """
+    Lê o CSV da folha uma vez por processo (compartilhado entre instâncias)
+    
+    Args:
+        csv_path: Caminho do CSV
+        mtime: Data de modificação do arquivo; alterações no CSV geram nova leitura
+        
+    Returns:
+        DataFrame somente leitura com os dados da folha
+    """
+    return pd.read_csv(csv_path, dtype=_CATEGORY_COLUMNS)
+
 class PayrollRAG:
     """Sistema RAG para consultas de folha de pagamento"""
     
-    def __init__(self, csv_path: str = "data/payroll.csv"):
+    # Competências de cada período das consultas agregadas
+    AGGREGATE_PERIODS = {
+        'trimestre': ['2025-01', '2025-02', '2025-03'],  # 1º trimestre
+        'semestre': ['2025-01', '2025-02', '2025-03', '2025-04', '2025-05', '2025-06'],
+    }
+    
+    def __init__(self, csv_path: str = "data/payroll.csv", data: Optional[pd.DataFrame] = None):
+        """
+        Inicializa o RAG
+        
+        Args:
+            csv_path: Caminho do CSV, lido na primeira consulta
+            data: Dados já carregados (opcional); dispensa a leitura do CSV
+        """
         self.csv_path = csv_path
         self.df = pd.DataFrame()
-        self.month_mapping = {
-            'janeiro': '01', 'jan': '01', 'jan.': '01',
-            'fevereiro': '02', 'fev': '02', 'fev.': '02',
-            'março': '03', 'mar': '03', 'mar.': '03',
-            'abril': '04', 'abr': '04', 'abr.': '04',
-            'maio': '05', 'mai': '05', 'mai.': '05',
-            'junho': '06', 'jun': '06', 'jun.': '06',
-            'julho': '07', 'jul': '07', 'jul.': '07',
-            'agosto': '08', 'ago': '08', 'ago.': '08',
-            'setembro': '09', 'set': '09', 'set.': '09',
-            'outubro': '10', 'out': '10', 'out.': '10',
-            'novembro': '11', 'nov': '11', 'nov.': '11',
-            'dezembro': '12', 'dez': '12', 'dez.': '12'
-        }
+        # Posições das linhas por nome do funcionário (minúsculo), por competência
+        # e por (nome, competência)
+        self._name_index: Dict[str, np.ndarray] = {}
+        self._competency_index: Dict[str, np.ndarray] = {}
+        self._name_competency_index: Dict[Tuple[str, str], np.ndarray] = {}
+        # Totais por período (None = todos os registros), calculados na carga
+        self._aggregate_stats: Dict[Optional[str], Dict[str, Any]] = {}
+        # Resultados de consultas repetidas (chave: consulta normalizada)
+        self._query_cache = TTLCache(maxsize=1024, ttl=600)
+        # Resultados por intenção extraída, compartilhados entre paráfrases
+        self._intent_cache = TTLCache(maxsize=1024, ttl=600)
+        
+        if data is not None:
+            self._load_data(data)
     
-    def _load_data(self):
-        """Carrega os dados do CSV"""
+    def _load_data(self, data: Optional[pd.DataFrame] = None):
+        """
+        Carrega os dados do CSV ou do DataFrame informado
+        
+        Args:
+            data: Dados já carregados (opcional)
+        """
         try:
-            self.df = pd.read_csv(self.csv_path)
+            self._query_cache.clear()
+            self._intent_cache.clear()
+            if data is None:
+                data = _read_payroll_csv(self.csv_path, os.path.getmtime(self.csv_path))
+            else:
+                # Mesmos tipos da leitura do CSV (astype também copia os dados)
+                data = data.astype({
+                    column: dtype for column, dtype in _CATEGORY_COLUMNS.items()
+                    if column in data.columns
+                })
+            self.df = data
+            self._build_indexes()
             logger.info(f"Dados carregados: {len(self.df)} registros")
         except Exception as e:
             logger.error(f"Erro ao carregar dados: {e}")
             self.df = pd.DataFrame()
+            self._name_index = {}
+            self._competency_index = {}
+            self._name_competency_index = {}
+            self._aggregate_stats = {}
     
-    def _parse_date_variations(self, date_str: str) -> Optional[str]:
-        """Converte variações de data para formato YYYY-MM"""
-        if not date_str:
-            return None
-        
-        date_str = date_str.lower().strip()
-        
-        # Formato: maio/2025, maio 2025
-        for month_name, month_num in self.month_mapping.items():
-            if month_name in date_str:
-                year_match = re.search(r'(\d{4})', date_str)
-                if year_match:
-                    year = year_match.group(1)
-                    return f"{year}-{month_num}"
+    def _build_indexes(self):
+        """Monta índices de busca sobre os dados carregados"""
+        names = self.df['name'].astype(str).str.lower()
+        competencies = self.df['competency'].astype(str)
+        self._name_index = dict(self.df.groupby(names.values).indices)
+        self._competency_index = dict(self.df.groupby(competencies.values).indices)
+        self._name_competency_index = dict(
+            self.df.groupby([names.values, competencies.values]).indices
+        )
+        
+        # Os dados não mudam após a carga: os agregados são calculados uma vez
+        periods = {None: None, **self.AGGREGATE_PERIODS}
+        self._aggregate_stats = {}
+        for period, months in periods.items():
+            filtered = self.df if months is None else self.df[self.df['competency'].isin(months)]
+            # Total e média numa única chamada sobre a coluna
+            net_pay = filtered['net_pay'].agg(['sum', 'mean'])
+            self._aggregate_stats[period] = {
+                "total": net_pay['sum'],
+                "mean": net_pay['mean'],
+                "count": len(filtered),
+                "months": months,
+                "evidence": self._create_evidence(filtered)
+            }
+    
+    def _month_competency(self, text: str) -> Optional[str]:
+        """
+        Converte o primeiro mês citado (nome ou abreviação) em YYYY-MM
         
-        # Formato: 2025-05, 05/2025
-        if re.match(r'\d{4}-\d{2}', date_str):
-            return date_str
-        if re.match(r'\d{2}/\d{4}', date_str):
-            parts = date_str.split('/')
-            return f"{parts[1]}-{parts[0]}"
+        Args:
+            text: Texto em minúsculas
+            
+        Returns:
+            Competência ou None se não houver mês e ano no texto
+        """
+        match = _MONTH_PATTERN.search(text)
+        if not match:
+            return None
         
-        return None
+        # Ano junto do mês ou, na falta dele, o primeiro ano do texto
+        year = match.group(2)
+        if not year:
+            year_match = _YEAR_PATTERN.search(text)
+            if not year_match:
+                return None
+            year = year_match.group(1)
+        return f"{year}-{_MONTH_NUMBERS[match.group(1)]}"
     
-    def _extract_employee_name(self, query: str) -> Optional[str]:
+    def _extract_employee_name(self, query: str, query_lower: Optional[str] = None) -> Optional[str]:
         """Extrai nome do funcionário da consulta"""
-        # Nomes conhecidos
-        known_names = ['Ana Souza', 'Bruno Lima']
-        
-        for name in known_names:
-            if name.lower() in query.lower():
-                return name
+        if query_lower is None:
+            query_lower = query.lower()
         
-        # Busca por padrões como "Ana", "Bruno"
-        name_patterns = [
-            r'\b(Ana|Bruno)\b',
-            r'\b(Ana Souza|Bruno Lima)\b'
-        ]
-        
-        for pattern in name_patterns:
-            match = re.search(pattern, query, re.IGNORECASE)
-            if match:
-                found = match.group(1)
-                if found in ['Ana', 'Bruno']:
-                    return 'Ana Souza' if found == 'Ana' else 'Bruno Lima'
+        # Nome, sobrenome ou nome completo, em qualquer caixa
+        match = _EMPLOYEE_NAME_PATTERN.search(query_lower)
+        if match:
+            return _EMPLOYEE_NAMES[match.lastgroup]
         
         return None
     
-    def _extract_competency(self, query: str) -> Optional[str]:
+    def _extract_competency(self, query: str, query_lower: Optional[str] = None) -> Optional[str]:
         """Extrai competência da consulta"""
-        query_lower = query.lower()
-        
-        # Busca por padrões de data
-        date_patterns = [
-            r'\b(\d{4}-\d{2})\b',  # 2025-01
-            r'\b(\d{2}/\d{4})\b',  # 01/2025
-            r'\b(janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)\s+(\d{4})\b',
-            r'\b(jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)\.?\s+(\d{4})\b'
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, query_lower)
-            if match:
-                if len(match.groups()) == 1:
-                    return self._parse_date_variations(match.group(1))
-                else:
-                    month, year = match.groups()
-                    return self._parse_date_variations(f"{month} {year}")
-        
-        # Busca por meses específicos na query
-        for month_name, month_num in self.month_mapping.items():
-            if month_name in query_lower:
-                # Procura por ano na query
-                year_match = re.search(r'(\d{4})', query_lower)
-                if year_match:
-                    year = year_match.group(1)
-                    return f"{year}-{month_num}"
-        
-        return None
+        if query_lower is None:
+            query_lower = query.lower()
+        
+        # Busca por padrões numéricos de data
+        match = _YEAR_MONTH_PATTERN.search(query_lower)
+        if match:
+            return match.group(1)
+        match = _MONTH_YEAR_PATTERN.search(query_lower)
+        if match:
+            month, year = match.groups()
+            return f"{year}-{month}"
+        
+        # Busca por meses (nome ou abreviação) em uma única passada
+        return self._month_competency(query_lower)
     
     def _format_currency(self, value: float) -> str:
         """Formata valor como moeda brasileira"""
-        return f"R$ {value:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+        return _format_brl(value)
     
     def _format_date(self, date_str: str) -> str:
         """Formata data para formato brasileiro"""
@@ -133,43 +235,144 @@ class PayrollRAG:
     
     def _create_evidence(self, filtered_df: pd.DataFrame) -> List[Dict[str, Any]]:
         """Cria evidências das consultas"""
-        evidence = []
+        format_currency = self._format_currency
         
-        for _, record in filtered_df.iterrows():
-            evidence.append({
+        # Cada coluna vira lista de escalares Python de uma vez (em C); o texto
+        # e os metadados saem numa única passada sobre as colunas
+        return [
+            {
                 "source": "payroll_data",
-                "content": f"Funcionário: {record['name']}, Competência: {record['competency']}, Salário Líquido: {self._format_currency(record['net_pay'])}",
+                "content": f"Funcionário: {name}, Competência: {competency}, Salário Líquido: {format_currency(net_pay)}",
                 "metadata": {
-                    "employee_id": record['employee_id'],
-                    "competency": record['competency'],
-                    "net_pay": record['net_pay']
+                    "employee_id": employee_id,
+                    "competency": competency,
+                    "net_pay": net_pay
                 }
-            })
-        
-        return evidence
+            }
+            for employee_id, name, competency, net_pay in zip(
+                filtered_df['employee_id'].tolist(),
+                filtered_df['name'].tolist(),
+                filtered_df['competency'].tolist(),
+                filtered_df['net_pay'].tolist()
+            )
+        ]
     
-    def _determine_query_type(self, query: str) -> str:
+    def _determine_query_type(self, query: str, query_lower: Optional[str] = None) -> str:
         """Determina o tipo de consulta"""
-        query_lower = query.lower()
-        
-        # Consulta por funcionário específico
-        if any(name in query_lower for name in ['ana', 'bruno', 'souza', 'lima']):
-            return "specific_employee"
+        if query_lower is None:
+            query_lower = query.lower()
         
-        # Consulta agregada
-        if any(word in query_lower for word in ['total', 'média', 'médio', 'soma', 'somar', 'trimestre', 'semestre']):
-            return "aggregate"
+        found = set()
+        for match in _QUERY_TYPE_PATTERN.finditer(query_lower):
+            # Consulta por funcionário específico tem a maior prioridade
+            if match.lastgroup == "specific_employee":
+                return "specific_employee"
+            found.add(match.lastgroup)
         
-        # Consulta por competência específica
-        if any(word in query_lower for word in ['maio', 'junho', 'julho', 'agosto', 'setembro', 'outubro', 'novembro', 'dezembro', 'janeiro', 'fevereiro', 'março', 'abril']):
-            return "competency"
+        # Consulta agregada ou por competência específica
+        for query_type in _QUERY_TYPE_PRIORITY[1:]:
+            if query_type in found:
+                return query_type
         
         return "general"
     
-    async def _query_specific_employee(self, query: str) -> Dict[str, Any]:
+    def _employee_focus(self, query_lower: str, has_competency: bool) -> str:
+        """
+        Identifica o campo pedido numa consulta por funcionário
+        
+        Args:
+            query_lower: Consulta do usuário em minúsculas
+            has_competency: Se a consulta indica uma competência
+            
+        Returns:
+            Campo da resposta (inss, bonus, payment_date, net_pay, max_bonus ou history)
+        """
+        mentions_bonus = 'bônus' in query_lower or 'bonus' in query_lower
+        
+        if has_competency:
+            if 'inss' in query_lower:
+                return "inss"
+            if mentions_bonus:
+                return "bonus"
+            if 'quando' in query_lower or 'data' in query_lower:
+                return "payment_date"
+            return "net_pay"
+        
+        if 'maior' in query_lower and mentions_bonus:
+            return "max_bonus"
+        return "history"
+    
+    def _aggregate_period(self, query_lower: str) -> Optional[str]:
+        """Período de uma consulta agregada (None = todos os registros)"""
+        if 'trimestre' in query_lower:
+            return 'trimestre'
+        if 'semestre' in query_lower:
+            return 'semestre'
+        return None
+    
+    def _analyze_query(self, query: str, query_lower: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analisa a consulta uma única vez: tipo e informações usadas na resposta
+        
+        Args:
+            query: Consulta do usuário
+            query_lower: Consulta em minúsculas (calculada se omitida)
+            
+        Returns:
+            Dicionário com "type" e, conforme o tipo, "employee", "competency",
+            "focus" (campo pedido) ou "period"
+        """
+        if query_lower is None:
+            query_lower = query.lower()
+        
+        query_type = self._determine_query_type(query, query_lower)
+        if query_type == "specific_employee":
+            return {"type": query_type, **self._employee_info(query, query_lower)}
+        if query_type == "aggregate":
+            return {"type": query_type, "period": self._aggregate_period(query_lower)}
+        return {"type": query_type, "competency": self._extract_competency(query, query_lower)}
+    
+    def _employee_info(self, query: str, query_lower: str) -> Dict[str, Any]:
+        """Funcionário, competência e campo pedido numa consulta por funcionário"""
+        competency = self._extract_competency(query, query_lower)
+        return {
+            "employee": self._extract_employee_name(query, query_lower),
+            "competency": competency,
+            "focus": self._employee_focus(query_lower, bool(competency))
+        }
+    
+    def _intent_key(self, info: Dict[str, Any]) -> Optional[tuple]:
+        """
+        Monta a intenção da consulta a partir das informações extraídas
+        
+        Consultas diferentes com a mesma intenção ("salário da Ana em maio 2025"
+        e "Ana Souza recebeu quanto em 2025-05?") produzem a mesma resposta.
+        
+        Args:
+            info: Resultado de _analyze_query
+            
+        Returns:
+            Chave da intenção ou None se a consulta não for identificada
+        """
+        query_type = info["type"]
+        if query_type == "specific_employee":
+            if not info["employee"]:
+                return None
+            return (query_type, info["employee"], info["competency"], info["focus"])
+        
+        if query_type == "aggregate":
+            return (query_type, info["period"])
+        
+        if not info["competency"]:
+            return None
+        return ("competency", info["competency"])
+    
+    def _query_specific_employee(self, query: str, info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Consulta por funcionário específico"""
-        employee_name = self._extract_employee_name(query)
-        competency = self._extract_competency(query)
+        if info is None:
+            info = self._employee_info(query, query.lower())
+        employee_name = info["employee"]
+        competency = info["competency"]
         
         if not employee_name:
             return {
@@ -178,11 +381,12 @@ class PayrollRAG:
                 "evidence": None
             }
         
-        # Filtra por funcionário
-        filtered = self.df[self.df['name'].str.contains(employee_name, case=False, na=False)]
-        
+        # Filtra por funcionário e competência (busca no índice em vez de varrer colunas)
         if competency:
-            filtered = filtered[filtered['competency'] == competency]
+            positions = self._name_competency_index.get((employee_name.lower(), competency), [])
+        else:
+            positions = self._name_index.get(employee_name.lower(), [])
+        filtered = self.df.iloc[positions]
         
         if filtered.empty:
             return {
@@ -194,23 +398,25 @@ class PayrollRAG:
         # Monta resposta
         response_parts = []
         
+        focus = info["focus"]
+        
         if competency:
             # Consulta específica por competência
             if not filtered.empty:
                 record = filtered.iloc[0]
                 
                 # Verifica se é consulta sobre INSS
-                if 'inss' in query.lower():
+                if focus == "inss":
                     response_parts.append(
                         f"Desconto de INSS de {employee_name} em {competency}: {self._format_currency(record['deductions_inss'])}"
                     )
                 # Verifica se é consulta sobre bônus
-                elif 'bônus' in query.lower() or 'bonus' in query.lower():
+                elif focus == "bonus":
                     response_parts.append(
                         f"Bônus de {employee_name} em {competency}: {self._format_currency(record['bonus'])}"
                     )
                 # Verifica se é consulta sobre data de pagamento
-                elif 'quando' in query.lower() or 'data' in query.lower():
+                elif focus == "payment_date":
                     payment_date = self._format_date(record['payment_date'])
                     response_parts.append(
                         f"Salário de {employee_name} em {competency}: {self._format_currency(record['net_pay'])} (pago em {payment_date})"
@@ -225,18 +431,20 @@ class PayrollRAG:
                 )
         else:
             # Consulta geral do funcionário
-            if 'maior' in query.lower() and ('bônus' in query.lower() or 'bonus' in query.lower()):
-                # Encontra o maior bônus
-                max_bonus_idx = filtered['bonus'].idxmax()
-                record = filtered.loc[max_bonus_idx]
+            if focus == "max_bonus":
+                # Encontra o maior bônus (posição no array, sem busca por rótulo)
+                record = filtered.iloc[int(filtered['bonus'].to_numpy().argmax())]
                 response_parts.append(
                     f"Maior bônus de {employee_name}: {self._format_currency(record['bonus'])} em {record['competency']}"
                 )
             else:
-                for _, record in filtered.iterrows():
-                    response_parts.append(
-                        f"{record['name']} - {record['competency']}: {self._format_currency(record['net_pay'])}"
+                # Percorre só as colunas usadas, sem montar uma Series por linha
+                response_parts.extend(
+                    f"{name} - {competency}: {self._format_currency(net_pay)}"
+                    for name, competency, net_pay in zip(
+                        filtered['name'], filtered['competency'], filtered['net_pay'].to_numpy()
                     )
+                )
         
         evidence = self._create_evidence(filtered)
         
@@ -246,55 +454,37 @@ class PayrollRAG:
             "evidence": evidence
         }
     
-    async def _query_aggregate(self, query: str) -> Dict[str, Any]:
+    def _query_aggregate(self, query: str, info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Consulta agregada (total, média, trimestre)"""
-        query_lower = query.lower()
-        
         # Determina período
-        if 'trimestre' in query_lower:
-            months = ['2025-01', '2025-02', '2025-03']  # 1º trimestre
-        elif 'semestre' in query_lower:
-            months = ['2025-01', '2025-02', '2025-03', '2025-04', '2025-05', '2025-06']
-        else:
-            months = None
-        
-        # Filtra dados
-        if months:
-            filtered = self.df[self.df['competency'].isin(months)]
-        else:
-            filtered = self.df
-        
-        if filtered.empty:
+        period = info["period"] if info else self._aggregate_period(query.lower())
+        stats = self._aggregate_stats.get(period)
+        if not stats or not stats["count"]:
             return {
                 "success": False,
                 "data": "Nenhum dado encontrado para o período solicitado",
                 "evidence": None
             }
         
-        # Calcula totais
-        total_net = filtered['net_pay'].sum()
-        avg_net = filtered['net_pay'].mean()
-        count = len(filtered)
+        months = stats["months"]
         
         # Monta resposta
-        response = f"Total: {self._format_currency(total_net)}"
-        response += f" | Média: {self._format_currency(avg_net)}"
-        response += f" | Registros: {count}"
+        response = f"Total: {self._format_currency(stats['total'])}"
+        response += f" | Média: {self._format_currency(stats['mean'])}"
+        response += f" | Registros: {stats['count']}"
         
         if months:
             response += f" - {len(months)}º trimestre 2025"
         
-        evidence = self._create_evidence(filtered)
-        
         return {
             "success": True,
             "data": response,
-            "evidence": evidence
+            "evidence": stats["evidence"]
         }
     
-    async def _query_competency(self, query: str) -> Dict[str, Any]:
+    def _query_competency(self, query: str, info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Consulta por competência específica"""
-        competency = self._extract_competency(query)
+        competency = info["competency"] if info else self._extract_competency(query)
         
         if not competency:
             return {
@@ -303,8 +493,8 @@ class PayrollRAG:
                 "evidence": None
             }
         
-        # Filtra por competência
-        filtered = self.df[self.df['competency'] == competency]
+        # Filtra por competência (busca no índice em vez de comparar a coluna inteira)
+        filtered = self.df.iloc[self._competency_index.get(competency, [])]
         
         if filtered.empty:
             return {
@@ -313,14 +503,11 @@ class PayrollRAG:
                 "evidence": None
             }
         
-        # Monta resposta
-        response_parts = []
-        for _, record in filtered.iterrows():
-            response_parts.append(
-                f"{record['name']}: {self._format_currency(record['net_pay'])}"
-            )
-        
-        response = f"Folha de {competency}:\n" + "\n".join(response_parts)
+        # Monta resposta percorrendo as colunas (sem uma Series por linha)
+        response = f"Folha de {competency}:\n" + "\n".join(
+            f"{name}: {self._format_currency(net_pay)}"
+            for name, net_pay in zip(filtered['name'], filtered['net_pay'].to_numpy())
+        )
         
         evidence = self._create_evidence(filtered)
         
@@ -332,6 +519,13 @@ class PayrollRAG:
     
     async def query(self, query: str) -> Dict[str, Any]:
         """Processa consulta usando RAG"""
+        # Espaços extras e caixa não mudam a resposta
+        query = " ".join(query.split())
+        cache_key = query.lower()
+        cached = self._query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             # Carrega dados se necessário
             if self.df.empty:
@@ -344,16 +538,30 @@ class PayrollRAG:
                     "evidence": None
                 }
             
-            # Determina tipo de consulta
-            query_type = self._determine_query_type(query)
+            # Tipo e informações extraídos numa única análise, repassada aos handlers
+            info = self._analyze_query(query)
+            query_type = info["type"]
+            
+            # Paráfrase de uma consulta já respondida
+            intent = self._intent_key(info)
+            if intent is not None:
+                result = self._intent_cache.get(intent)
+                if result is not None:
+                    self._query_cache.set(cache_key, result)
+                    return result
             
             # Processa consulta
             if query_type == "specific_employee":
-                return await self._query_specific_employee(query)
+                result = self._query_specific_employee(query, info)
             elif query_type == "aggregate":
-                return await self._query_aggregate(query)
+                result = self._query_aggregate(query, info)
             else:
-                return await self._query_competency(query)
+                result = self._query_competency(query, info)
+            
+            self._query_cache.set(cache_key, result)
+            if intent is not None:
+                self._intent_cache.set(intent, result)
+            return result
                 
         except Exception as e:
             logger.error(f"Erro ao processar consulta: {e}")
@@ -2,82 +2,224 @@
 Sistema de busca na web para consultas de legislação trabalhista
 """
 import os
-import requests
+import asyncio
+import httpx
 import logging
-from typing import Dict, Any, List
+import orjson
+import re
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional
+
+from ..utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Temas dos dados de fallback, reconhecidos numa única passada; se a consulta
+# cita mais de um, vale a ordem de _FALLBACK_TOPIC_PRIORITY
+_FALLBACK_TOPIC_PRIORITY = ("selic", "ferias", "fgts", "inss")
+_FALLBACK_TOPIC_PATTERN = re.compile(
+    r'(?P<selic>selic|juros)'
+    r'|(?P<ferias>f[eé]rias)'
+    r'|(?P<fgts>fgts|fundo de garantia)'
+    r'|(?P<inss>inss|previd[eê]ncia)'
+)
+
+# Dados de fallback para demonstração com informações específicas (somente
+# leitura: _fallback_search devolve cópias)
+_FALLBACK_DATA = MappingProxyType({
+    "selic": {
+        "title": "Taxa Selic Atual - Banco Central do Brasil",
+        "url": "https://www.bcb.gov.br/controleinflacao/historicotaxasjuros",
+        "snippet": "A Taxa Selic é a taxa básica de juros da economia brasileira.",
+        "relevance_score": 0.95,
+        "specific_data": {
+            "taxa_selic": "10,50% ao ano",
+            "data_atualizacao": "Janeiro 2025",
+            "fonte": "Banco Central do Brasil"
+        }
+    },
+    "ferias": {
+        "title": "Férias Proporcionais - CLT Art. 130",
+        "url": "https://www.planalto.gov.br/ccivil_03/decreto-lei/del5452.htm",
+        "snippet": "As férias proporcionais são devidas ao empregado que não completou 12 meses de trabalho.",
+        "relevance_score": 0.90,
+        "specific_data": {
+            "regra": "1/12 avos por mês trabalhado",
+            "base_calculo": "Salário base + adicionais",
+            "fonte": "CLT Art. 130"
+        }
+    },
+    "fgts": {
+        "title": "FGTS - Fundo de Garantia do Tempo de Serviço",
+        "url": "https://www.caixa.gov.br/fgts",
+        "snippet": "O FGTS é um fundo de garantia para trabalhadores com carteira assinada.",
+        "relevance_score": 0.90,
+        "specific_data": {
+            "percentual": "8% sobre o salário",
+            "deposito": "Mensal pelo empregador",
+            "fonte": "Lei 5.107/1966"
+        }
+    },
+    "inss": {
+        "title": "INSS - Instituto Nacional do Seguro Social",
+        "url": "https://www.gov.br/inss",
+        "snippet": "O INSS é responsável pelo pagamento de benefícios previdenciários.",
+        "relevance_score": 0.90,
+        "specific_data": {
+            "aliquotas": "7,5% a 14% (tabela progressiva)",
+            "teto": "R$ 7.507,49 (2025)",
+            "fonte": "INSS"
+        }
+    }
+})
+
+# Resultado de fallback quando a consulta não cita nenhum tema conhecido
+_FALLBACK_DEFAULT = {
+    "title": "Legislação Trabalhista - CLT",
+    "url": "https://www.planalto.gov.br/ccivil_03/decreto-lei/del5452.htm",
+    "snippet": "A Consolidação das Leis do Trabalho (CLT) é o conjunto de normas que regulam as relações individuais e coletivas de trabalho no Brasil.",
+    "relevance_score": 0.8,
+    "specific_data": {
+        "fonte": "CLT - Consolidação das Leis do Trabalho",
+        "vigencia": "Desde 1943",
+        "fonte": "Decreto-Lei 5.452/1943"
+    }
+}
+
+# Rótulo de cada campo de specific_data na resposta com citação
+_SPECIFIC_DATA_LABELS = {
+    "taxa_selic": "💰 **Taxa Selic Atual:** ",
+    "data_atualizacao": "📅 **Data de Atualização:** ",
+    "percentual": "📈 **Percentual:** ",
+    "aliquotas": "📊 **Alíquotas:** ",
+    "teto": "🎯 **Teto:** ",
+    "regra": "📋 **Regra:** ",
+    "base_calculo": "🧮 **Base de Cálculo:** ",
+    "deposito": "💳 **Depósito:** ",
+    "fonte": "📚 **Fonte:** ",
+    "vigencia": "⏰ **Vigência:** ",
+}
+
+def _specific_data_text(result: Dict[str, Any]) -> str:
+    """
+    Monta a parte da resposta com citação que não depende da consulta
+    
+    Args:
+        result: Resultado com specific_data
+        
+    Returns:
+        Dados específicos rotulados (campos sem rótulo são omitidos) e a URL da fonte
+    """
+    lines = [
+        f"{_SPECIFIC_DATA_LABELS[key]}{value}\n"
+        for key, value in result['specific_data'].items()
+        if key in _SPECIFIC_DATA_LABELS
+    ]
+    lines.append(f"\n🔗 **Fonte:** {result.get('url', 'URL não disponível')}")
+    return "".join(lines)
+
+# Os resultados de fallback são fixos: o texto de cada tema é montado no import
+# (None = resultado padrão)
+_FALLBACK_TEXTS = {
+    **{topic: _specific_data_text(result) for topic, result in _FALLBACK_DATA.items()},
+    None: _specific_data_text(_FALLBACK_DEFAULT)
+}
+
 class WebSearch:
     """Sistema de busca na web para legislação trabalhista"""
     
+    __slots__ = (
+        "api_key", "search_engine_id", "use_fallback",
+        "_client", "_google_cache", "_citation_cache", "_inflight"
+    )
+    
+    # Tempo máximo (segundos) de espera pelo Google antes de usar o fallback
+    GOOGLE_TIMEOUT = float(os.getenv("GOOGLE_TIMEOUT", "2.0"))
+    
     def __init__(self):
         """Inicializa o sistema de busca"""
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
         self.use_fallback = not (self.api_key and self.search_engine_id)
         
-        # Dados de fallback para demonstração com informações específicas
-        self.fallback_data = {
-            "selic": {
-                "title": "Taxa Selic Atual - Banco Central do Brasil",
-                "url": "https://www.bcb.gov.br/controleinflacao/historicotaxasjuros",
-                "snippet": "A Taxa Selic é a taxa básica de juros da economia brasileira.",
-                "relevance_score": 0.95,
-                "specific_data": {
-                    "taxa_selic": "10,50% ao ano",
-                    "data_atualizacao": "Janeiro 2025",
-                    "fonte": "Banco Central do Brasil"
-                }
-            },
-            "ferias": {
-                "title": "Férias Proporcionais - CLT Art. 130",
-                "url": "https://www.planalto.gov.br/ccivil_03/decreto-lei/del5452.htm",
-                "snippet": "As férias proporcionais são devidas ao empregado que não completou 12 meses de trabalho.",
-                "relevance_score": 0.90,
-                "specific_data": {
-                    "regra": "1/12 avos por mês trabalhado",
-                    "base_calculo": "Salário base + adicionais",
-                    "fonte": "CLT Art. 130"
-                }
-            },
-            "fgts": {
-                "title": "FGTS - Fundo de Garantia do Tempo de Serviço",
-                "url": "https://www.caixa.gov.br/fgts",
-                "snippet": "O FGTS é um fundo de garantia para trabalhadores com carteira assinada.",
-                "relevance_score": 0.90,
-                "specific_data": {
-                    "percentual": "8% sobre o salário",
-                    "deposito": "Mensal pelo empregador",
-                    "fonte": "Lei 5.107/1966"
-                }
-            },
-            "inss": {
-                "title": "INSS - Instituto Nacional do Seguro Social",
-                "url": "https://www.gov.br/inss",
-                "snippet": "O INSS é responsável pelo pagamento de benefícios previdenciários.",
-                "relevance_score": 0.90,
-                "specific_data": {
-                    "aliquotas": "7,5% a 14% (tabela progressiva)",
-                    "teto": "R$ 7.507,49 (2025)",
-                    "fonte": "INSS"
-                }
-            }
+        # Cliente HTTP assíncrono criado na primeira busca; mantém as conexões
+        # (TCP + TLS) abertas entre buscas
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Resultados do Google por consulta enviada (economiza latência e cota da API)
+        self._google_cache = TTLCache(maxsize=256, ttl=3600)
+        
+        # Buscas no Google em andamento por consulta: pedidos simultâneos iguais
+        # aguardam a mesma requisição
+        self._inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        
+        # Respostas com citação prontas por consulta (só as bem-sucedidas)
+        self._citation_cache = TTLCache(maxsize=1024, ttl=3600)
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Obtém o cliente HTTP, criando-o na primeira chamada"""
+        if self._client is None:
+            # Conexões ociosas ficam abertas por 60s para reaproveitar o TLS
+            limits = httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=32,
+                keepalive_expiry=60.0
+            )
+            self._client = httpx.AsyncClient(limits=limits, timeout=10.0)
+        return self._client
+    
+    async def aclose(self):
+        """Fecha o cliente HTTP, se já tiver sido criado"""
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+    
+    def cache_info(self) -> Dict[str, Dict[str, Any]]:
+        """Obtém estatísticas dos caches de busca"""
+        return {
+            "google": self._google_cache.cache_info(),
+            "citation": self._citation_cache.cache_info()
         }
     
     async def search(self, query: str) -> Dict[str, Any]:
         """Executa busca na web"""
         try:
             if self.use_fallback:
-                return await self._fallback_search(query)
+                return self._fallback_search(query)
             else:
-                return await self._google_search(query)
+                return await asyncio.wait_for(self._google_search(query), timeout=self.GOOGLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Busca Google excedeu {self.GOOGLE_TIMEOUT}s; usando fallback")
+            return self._fallback_search(query)
         except Exception as e:
             logger.error(f"Erro na busca: {e}")
-            return await self._fallback_search(query)
+            return self._fallback_search(query)
     
     async def _google_search(self, query: str) -> Dict[str, Any]:
         """Executa busca usando Google Custom Search API"""
+        cached = self._google_cache.get(query)
+        if cached is not None:
+            return cached
+        
+        task = self._inflight.get(query)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_google(query))
+            self._inflight[query] = task
+            task.add_done_callback(lambda _: self._inflight.pop(query, None))
+        
+        # shield: o tempo limite de um pedido não cancela a busca dos demais
+        return await asyncio.shield(task)
+    
+    async def _fetch_google(self, query: str) -> Dict[str, Any]:
+        """
+        Consulta a Google Custom Search API e armazena o resultado no cache
+        
+        Args:
+            query: Consulta enviada
+            
+        Returns:
+            Resultados da busca (ou do fallback, em caso de erro)
+        """
         try:
             base_url = "https://www.googleapis.com/customsearch/v1"
             params = {
@@ -88,68 +230,69 @@ class WebSearch:
                 "lr": "lang_pt"
             }
             
-            response = requests.get(base_url, params=params, timeout=10)
+            response = await self._get_client().get(base_url, params=params)
             response.raise_for_status()
             
-            data = response.json()
+            data = orjson.loads(response.content)
             
-            results = []
-            if "items" in data:
-                for item in data["items"]:
-                    result = {
-                        "title": item.get("title", ""),
-                        "url": item.get("link", ""),
-                        "snippet": item.get("snippet", ""),
-                        "date": item.get("pagemap", {}).get("metatags", [{}])[0].get("article:published_time", "")
-                    }
-                    results.append(result)
+            results = [
+                {
+                    "title": item.get("title", ""),
+                    "url": item.get("link", ""),
+                    "snippet": item.get("snippet", ""),
+                    "date": item.get("pagemap", {}).get("metatags", [{}])[0].get("article:published_time", "")
+                }
+                for item in data.get("items", ())
+            ]
             
-            return {
+            result = {
                 "success": True,
                 "results": results[:5],
                 "query": query,
                 "total_results": len(results)
             }
+            self._google_cache.set(query, result)
+            return result
             
         except Exception as e:
             logger.error(f"Erro na busca Google: {e}")
-            return await self._fallback_search(query)
+            return self._fallback_search(query)
     
-    async def _fallback_search(self, query: str) -> Dict[str, Any]:
-        """Busca de fallback com dados pré-definidos"""
-        query_lower = query.lower()
+    def _fallback_search(self, query: str) -> Dict[str, Any]:
+        """
+        Busca de fallback com dados pré-definidos
+        
+        O resultado é marcado com "fallback" para não ir aos caches: quando o
+        Google volta a responder, a próxima consulta já usa a busca real.
+        """
+        found = {match.lastgroup for match in _FALLBACK_TOPIC_PATTERN.finditer(query.lower())}
+        topic = next((topic for topic in _FALLBACK_TOPIC_PRIORITY if topic in found), None)
         
         # Detecção inteligente de consultas específicas
-        if "selic" in query_lower or "taxa selic" in query_lower or "juros" in query_lower:
-            result = self.fallback_data["selic"]
-        elif "férias" in query_lower or "ferias" in query_lower or "férias proporcionais" in query_lower:
-            result = self.fallback_data["ferias"]
-        elif "fgts" in query_lower or "fundo de garantia" in query_lower:
-            result = self.fallback_data["fgts"]
-        elif "inss" in query_lower or "previdência" in query_lower or "previdencia" in query_lower:
-            result = self.fallback_data["inss"]
+        if topic is not None:
+            result = _FALLBACK_DATA[topic]
         else:
-            result = {
-                "title": "Legislação Trabalhista - CLT",
-                "url": "https://www.planalto.gov.br/ccivil_03/decreto-lei/del5452.htm",
-                "snippet": "A Consolidação das Leis do Trabalho (CLT) é o conjunto de normas que regulam as relações individuais e coletivas de trabalho no Brasil.",
-                "relevance_score": 0.8,
-                "specific_data": {
-                    "fonte": "CLT - Consolidação das Leis do Trabalho",
-                    "vigencia": "Desde 1943",
-                    "fonte": "Decreto-Lei 5.452/1943"
-                }
-            }
+            result = _FALLBACK_DEFAULT
         
+        # Cópia: o resultado vai ao chamador como evidência e os dados do
+        # módulo são compartilhados pelo processo
         return {
             "success": True,
-            "results": [result],
+            "results": [{**result, "specific_data": dict(result["specific_data"])}],
             "query": query,
-            "total_results": 1
+            "total_results": 1,
+            "fallback": True,
+            "topic": topic
         }
     
     async def search_with_citation(self, query: str) -> Dict[str, Any]:
         """Executa busca com citação de fontes"""
+        # A consulta aparece na resposta, então a caixa faz parte da chave
+        cache_key = " ".join(query.split())
+        cached = self._citation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             search_result = await self.search(query)
             
@@ -174,46 +317,32 @@ class WebSearch:
             
             # Monta resposta com dados específicos se disponíveis
             if 'specific_data' in first_result:
-                specific_data = first_result['specific_data']
-                response = f"📊 **Dados Específicos sobre '{query}':**\n\n"
-                
-                # Adiciona dados específicos
-                for key, value in specific_data.items():
-                    if key == 'taxa_selic':
-                        response += f"💰 **Taxa Selic Atual:** {value}\n"
-                    elif key == 'data_atualizacao':
-                        response += f"📅 **Data de Atualização:** {value}\n"
-                    elif key == 'percentual':
-                        response += f"📈 **Percentual:** {value}\n"
-                    elif key == 'aliquotas':
-                        response += f"📊 **Alíquotas:** {value}\n"
-                    elif key == 'teto':
-                        response += f"🎯 **Teto:** {value}\n"
-                    elif key == 'regra':
-                        response += f"📋 **Regra:** {value}\n"
-                    elif key == 'base_calculo':
-                        response += f"🧮 **Base de Cálculo:** {value}\n"
-                    elif key == 'deposito':
-                        response += f"💳 **Depósito:** {value}\n"
-                    elif key == 'fonte':
-                        response += f"📚 **Fonte:** {value}\n"
-                    elif key == 'vigencia':
-                        response += f"⏰ **Vigência:** {value}\n"
-                
-                response += f"\n🔗 **Fonte:** {first_result.get('url', 'URL não disponível')}"
+                if search_result.get("fallback"):
+                    specific_text = _FALLBACK_TEXTS[search_result["topic"]]
+                else:
+                    specific_text = _specific_data_text(first_result)
+                response = f"📊 **Dados Específicos sobre '{query}':**\n\n{specific_text}"
             else:
                 # Resposta padrão se não há dados específicos
-                response = f"Encontrei informações sobre '{query}':\n\n"
-                response += f"📋 {first_result.get('title', 'Título não disponível')}\n"
-                response += f"🔗 {first_result.get('url', 'URL não disponível')}\n"
-                response += f"📝 {first_result.get('snippet', 'Descrição não disponível')}"
+                response = (
+                    f"Encontrei informações sobre '{query}':\n\n"
+                    f"📋 {first_result.get('title', 'Título não disponível')}\n"
+                    f"🔗 {first_result.get('url', 'URL não disponível')}\n"
+                    f"📝 {first_result.get('snippet', 'Descrição não disponível')}"
+                )
             
-            return {
+            fallback = search_result.get("fallback", False)
+            result = {
                 "success": True,
                 "data": response,
                 "evidence": results,
-                "query": query
+                "query": query,
+                "fallback": fallback
             }
+            # Resultados de fallback (erro ou tempo limite do Google) não ficam no cache
+            if not fallback:
+                self._citation_cache.set(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"Erro na busca com citação: {e}")
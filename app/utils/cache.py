@@ -0,0 +1,80 @@
+"""
+Cache em memória com limite de tamanho (LRU) e tempo de expiração (TTL)
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+class TTLCache:
+    """Cache LRU com expiração por tempo de vida"""
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 3600):
+        """
+        Inicializa o cache
+
+        Args:
+            maxsize: Número máximo de entradas mantidas
+            ttl: Tempo de vida de cada entrada em segundos
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Obtém valor do cache
+
+        Args:
+            key: Chave da entrada
+            default: Valor retornado se a chave não existir ou tiver expirado
+
+        Returns:
+            Valor armazenado ou padrão
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Armazena valor no cache, removendo as entradas menos usadas se necessário
+
+        Args:
+            key: Chave da entrada
+            value: Valor a armazenar
+        """
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove todas as entradas"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def cache_info(self) -> Dict[str, Optional[float]]:
+        """Obtém estatísticas do cache"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl
+        }
@@ -4,7 +4,34 @@ Implementa formatação brasileira de moeda, datas e números
 """
 import re
 from datetime import datetime
-from typing import Union, Optional, List
+from functools import lru_cache
+from typing import Union, Optional, List, Tuple
+
+# Padrões compilados uma única vez no import
+_NON_NUMERIC_PATTERN = re.compile(r'[^\d,.-]')
+_COMPETENCY_PATTERN = re.compile(r'\d{4}-\d{2}')
+_MONTH_YEAR_PATTERN = re.compile(r'(\w+)[/-](\d{4})')
+
+# Datas aceitas: aaaa-mm-dd, aaaa/mm/dd, dd-mm-aaaa e dd/mm/aaaa (mesmo separador)
+_DATE_PATTERN = re.compile(
+    r'(?P<y1>\d{4})(?P<s1>[-/])(?P<m1>\d{1,2})(?P=s1)(?P<d1>\d{1,2})'
+    r'|(?P<d2>\d{1,2})(?P<s2>[-/])(?P<m2>\d{1,2})(?P=s2)(?P<y2>\d{4})'
+)
+
+# Nome de cada mês da competência (MM -> nome) e o inverso, em minúsculas
+_MONTH_NAMES = {
+    '01': 'Janeiro', '02': 'Fevereiro', '03': 'Março',
+    '04': 'Abril', '05': 'Maio', '06': 'Junho',
+    '07': 'Julho', '08': 'Agosto', '09': 'Setembro',
+    '10': 'Outubro', '11': 'Novembro', '12': 'Dezembro'
+}
+_MONTH_NUMBERS = {name.lower(): number for number, name in _MONTH_NAMES.items()}
+
+# Troca os separadores do formato americano (1,500.50) pelos brasileiros (1.500,50)
+_BRL_SEPARATORS = str.maketrans({',': '.', '.': ','})
+
+# Valor em formato brasileiro (1.500,50) para o formato do float (1500.50)
+_BRL_TO_FLOAT = str.maketrans({'.': None, ',': '.'})
 
 def format_currency(value: Union[float, str, int]) -> str:
     """
@@ -20,18 +47,13 @@ def format_currency(value: Union[float, str, int]) -> str:
         # Converte para float se necessário
         if isinstance(value, str):
             # Remove caracteres não numéricos exceto vírgula e ponto
-            value = re.sub(r'[^\d,.-]', '', value)
+            value = _NON_NUMERIC_PATTERN.sub('', value)
             # Substitui vírgula por ponto para conversão
             value = value.replace(',', '.')
             value = float(value)
         
-        # Formata com 2 casas decimais
-        formatted = f"{float(value):,.2f}"
-        
-        # Substitui vírgula por X, ponto por vírgula, X por ponto
-        formatted = formatted.replace(',', 'X').replace('.', ',').replace('X', '.')
-        
-        return f"R$ {formatted}"
+        # Formata com 2 casas decimais e troca os separadores numa só passada
+        return f"R$ {float(value):,.2f}".translate(_BRL_SEPARATORS)
         
     except (ValueError, TypeError):
         return "R$ 0,00"
@@ -51,24 +73,48 @@ def parse_currency(value: str) -> Optional[float]:
             return None
             
         # Remove caracteres não numéricos exceto vírgula e ponto
-        cleaned = re.sub(r'[^\d,.-]', '', value)
+        cleaned = _NON_NUMERIC_PATTERN.sub('', value)
         
         if not cleaned:
             return None
         
-        # Se tem vírgula e ponto, assume formato brasileiro (1.500,50)
-        if ',' in cleaned and '.' in cleaned:
-            # Remove pontos de milhares e substitui vírgula por ponto
-            cleaned = cleaned.replace('.', '').replace(',', '.')
-        elif ',' in cleaned and '.' not in cleaned:
-            # Apenas vírgula, assume formato brasileiro
-            cleaned = cleaned.replace(',', '.')
+        # Com vírgula, assume formato brasileiro (1.500,50 ou 1500,50): remove os
+        # pontos de milhares e troca a vírgula por ponto numa só passada
+        if ',' in cleaned:
+            cleaned = cleaned.translate(_BRL_TO_FLOAT)
         
         return float(cleaned)
         
     except (ValueError, TypeError):
         return None
 
+@lru_cache(maxsize=1024)
+def _split_date(date_str: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Separa ano, mês e dia de uma data, escolhendo o formato pela posição do ano
+    
+    Args:
+        date_str: String com data
+        
+    Returns:
+        Tupla (ano, mês, dia) de uma data válida ou None
+    """
+    match = _DATE_PATTERN.fullmatch(date_str)
+    if not match:
+        return None
+    
+    if match.group('y1'):
+        year, month, day = match.group('y1', 'm1', 'd1')
+    else:
+        year, month, day = match.group('y2', 'm2', 'd2')
+    
+    try:
+        # Valida o dia no calendário (ex.: 30/02 é inválido)
+        date_obj = datetime(int(year), int(month), int(day))
+    except ValueError:
+        return None
+    return date_obj.year, date_obj.month, date_obj.day
+
 def format_date(date_input: Union[str, datetime]) -> str:
     """
     Formata data para formato brasileiro (dd/mm/aaaa)
@@ -81,20 +127,10 @@ def format_date(date_input: Union[str, datetime]) -> str:
     """
     try:
         if isinstance(date_input, str):
-            # Tenta diferentes formatos de entrada
-            formats = [
-                '%Y-%m-%d',      # 2025-01-28
-                '%d/%m/%Y',      # 28/01/2025
-                '%d-%m-%Y',      # 28-01-2025
-                '%Y/%m/%d',      # 2025/01/28
-            ]
-            
-            for fmt in formats:
-                try:
-                    date_obj = datetime.strptime(date_input, fmt)
-                    return date_obj.strftime('%d/%m/%Y')
-                except ValueError:
-                    continue
+            parts = _split_date(date_input)
+            if parts:
+                year, month, day = parts
+                return f"{day:02d}/{month:02d}/{year}"
             
             # Se nenhum formato funcionou, retorna como está
             return date_input
@@ -124,20 +160,10 @@ def parse_date(date_str: str) -> Optional[str]:
         # Remove espaços extras
         date_str = date_str.strip()
         
-        # Tenta diferentes formatos de entrada
-        formats = [
-            '%d/%m/%Y',      # 28/01/2025
-            '%d-%m-%Y',      # 28-01-2025
-            '%Y-%m-%d',      # 2025-01-28
-            '%Y/%m/%d',      # 2025/01/28
-        ]
-        
-        for fmt in formats:
-            try:
-                date_obj = datetime.strptime(date_str, fmt)
-                return date_obj.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
+        parts = _split_date(date_str)
+        if parts:
+            year, month, day = parts
+            return f"{year}-{month:02d}-{day:02d}"
         
         return None
         
@@ -160,18 +186,10 @@ def format_competency(competency: str) -> str:
             return ""
         
         # Se já está no formato YYYY-MM
-        if re.match(r'\d{4}-\d{2}', competency):
+        if _COMPETENCY_PATTERN.match(competency):
             year, month = competency.split('-')
             
-            # Mapeamento de meses
-            month_names = {
-                '01': 'Janeiro', '02': 'Fevereiro', '03': 'Março',
-                '04': 'Abril', '05': 'Maio', '06': 'Junho',
-                '07': 'Julho', '08': 'Agosto', '09': 'Setembro',
-                '10': 'Outubro', '11': 'Novembro', '12': 'Dezembro'
-            }
-            
-            month_name = month_names.get(month, month)
+            month_name = _MONTH_NAMES.get(month, month)
             return f"{month_name}/{year}"
         
         return competency
@@ -196,25 +214,17 @@ def parse_competency(competency: str) -> Optional[str]:
         competency = competency.strip()
         
         # Se já está no formato YYYY-MM
-        if re.match(r'\d{4}-\d{2}', competency):
+        if _COMPETENCY_PATTERN.match(competency):
             return competency
         
         # Tenta converter de outros formatos
         # Ex: "Janeiro/2025" -> "2025-01"
-        month_mapping = {
-            'janeiro': '01', 'fevereiro': '02', 'março': '03',
-            'abril': '04', 'maio': '05', 'junho': '06',
-            'julho': '07', 'agosto': '08', 'setembro': '09',
-            'outubro': '10', 'novembro': '11', 'dezembro': '12'
-        }
-        
         # Padrão: mês/ano ou mês-ano
-        pattern = r'(\w+)[/-](\d{4})'
-        match = re.search(pattern, competency.lower())
+        match = _MONTH_YEAR_PATTERN.search(competency.lower())
         
         if match:
             month_name, year = match.groups()
-            month_num = month_mapping.get(month_name)
+            month_num = _MONTH_NUMBERS.get(month_name)
             if month_num:
                 return f"{year}-{month_num}"
         
@@ -1,33 +1,32 @@
 """
 Modelos Pydantic para o sistema de folha de pagamento
 """
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+from typing import Annotated, Optional, List, Dict, Any
+from datetime import datetime, timezone
 
 class ChatRequest(BaseModel):
     """Modelo para requisição de chat"""
-    message: str = Field(..., min_length=1, max_length=1000, description="Mensagem do usuário")
+    model_config = ConfigDict(frozen=True)
     
-    @validator('message')
-    def validate_message(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Mensagem não pode estar vazia')
-        return v.strip()
+    # Remoção de espaços e limites validados no pydantic-core, sem validador em Python
+    message: Annotated[
+        str,
+        StringConstraints(strip_whitespace=True, min_length=1, max_length=1000)
+    ] = Field(..., description="Mensagem do usuário")
 
 class ChatResponse(BaseModel):
     """Modelo para resposta do chat"""
+    model_config = ConfigDict(frozen=True)
+    
     response: str = Field(..., description="Resposta do chatbot")
     evidence: Optional[List[Dict[str, Any]]] = Field(None, description="Evidências da resposta")
     tool_used: str = Field(..., description="Ferramenta utilizada (rag, web, general)")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 class EvidenceSource(BaseModel):
     """Modelo para fonte de evidência"""
+    model_config = ConfigDict(frozen=True)
+    
     employee_id: str = Field(..., description="ID do funcionário")
     name: str = Field(..., description="Nome do funcionário")
     competency: str = Field(..., description="Competência")
@@ -40,6 +39,8 @@ class EvidenceSource(BaseModel):
 
 class Evidence(BaseModel):
     """Modelo para evidências da resposta"""
+    model_config = ConfigDict(frozen=True)
+    
     sources: List[EvidenceSource] = Field(..., description="Fontes de evidência")
     total_records: int = Field(..., ge=0, description="Total de registros")
     employee_ids: List[str] = Field(..., description="IDs dos funcionários")
@@ -49,8 +50,12 @@ class Evidence(BaseModel):
 
 class HealthCheck(BaseModel):
     """Modelo para health check"""
+    model_config = ConfigDict(frozen=True)
+    
     status: str = Field(..., description="Status do serviço")
-    timestamp: datetime = Field(default_factory=datetime.now, description="Timestamp")
+    timestamp: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), description="Timestamp (UTC)"
+    )
     version: str = Field(..., description="Versão do serviço")
     uptime: Optional[float] = Field(None, description="Tempo de atividade em segundos")
     dependencies: Optional[Dict[str, str]] = Field(None, description="Status das dependências")
\ No newline at end of file
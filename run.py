@@ -1,13 +1,42 @@
 """
 Script para executar a aplicação
 """
+import argparse
 import os
 import sys
 import uvicorn
 from pathlib import Path
 
+def parse_args() -> argparse.Namespace:
+    """Lê as opções de linha de comando"""
+    parser = argparse.ArgumentParser(
+        description="Executa a API do Chatbot de Folha de Pagamento",
+        epilog=(
+            "Desenvolvimento: python run.py --reload | "
+            "Produção: python run.py --workers N"
+        )
+    )
+    parser.add_argument(
+        "--reload",
+        action="store_true",
+        help="Reinicia o servidor a cada alteração no código (apenas desenvolvimento)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Número de processos (padrão: 1). As sessões de conversa ficam na memória "
+            "de cada processo; use mais de um só atrás de afinidade de sessão. "
+            f"Disponíveis: {os.cpu_count()} CPUs"
+        )
+    )
+    return parser.parse_args()
+
 def main():
     """Executa a aplicação"""
+    args = parse_args()
+    
     # Verifica se estamos no diretório correto
     if not Path("app/main.py").exists():
         print("❌ Erro: Execute este script a partir do diretório raiz do projeto")
@@ -22,15 +51,24 @@ def main():
     print("Iniciando Chatbot de Folha de Pagamento...")
     print("API disponivel em: http://localhost:8000")
     print("Documentacao em: http://localhost:8000/docs")
+    if args.reload:
+        print("Modo desenvolvimento: recarregamento automático ativado")
+    else:
+        print(f"Processos: {args.workers} (use --reload durante o desenvolvimento)")
     print("Pressione Ctrl+C para parar")
     
-    # Executa a aplicação
+    # Executa a aplicação (o uvicorn não combina reload com vários processos)
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
+        reload=args.reload,
+        workers=None if args.reload else args.workers,
+        log_level="info",
+        # uvicorn[standard]: event loop do uvloop (escolhido em "auto" quando
+        # instalado; não há uvloop no Windows) e parser HTTP do httptools
+        loop="auto",
+        http="httptools"
     )
 
 if __name__ == "__main__":
@@ -1,12 +1,23 @@
 """
 Fixtures para testes
+
+Dados de exemplo são somente leitura e criados uma vez por execução (escopo
+de sessão); testes que precisarem alterá-los devem trabalhar numa cópia.
 """
 import pytest
 import pandas as pd
 import os
 from typing import Dict, Any
 
-@pytest.fixture
+from app.tools.payroll_rag import PayrollRAG
+
+@pytest.fixture(scope="session")
+def payroll_rag():
+    """PayrollRAG com os dados do desafio, carregado uma vez por execução"""
+    csv_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'payroll.csv')
+    return PayrollRAG(csv_path)
+
+@pytest.fixture(scope="session")
 def sample_payroll_data():
     """Dados de exemplo para testes"""
     return pd.DataFrame({
@@ -17,7 +28,7 @@ def sample_payroll_data():
         'data': ['2024-01-01', '2024-01-01', '2024-01-01', '2024-01-01']
     })
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_web_results():
     """Resultados de exemplo para testes de web search"""
     return {
@@ -39,7 +50,7 @@ def sample_web_results():
         'success': True
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_rag_results():
     """Resultados de exemplo para testes de RAG"""
     return {
@@ -48,7 +59,7 @@ def sample_rag_results():
         'success': True
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_llm_config():
     """Configuração mock do LLM"""
     return {
@@ -57,7 +68,7 @@ def mock_llm_config():
         'temperature': 0.1
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_queries():
     """Consultas de exemplo para testes"""
     return {
@@ -80,7 +91,7 @@ def sample_queries():
         ]
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def expected_responses():
     """Respostas esperadas para testes"""
     return {
@@ -101,27 +112,12 @@ def expected_responses():
         }
     }
 
-@pytest.fixture
-def test_csv_path():
-    """Caminho para arquivo CSV de teste"""
-    return "data/test_payroll.csv"
-
-@pytest.fixture
-def create_test_csv(test_csv_path, sample_payroll_data):
-    """Cria arquivo CSV de teste"""
-    # Cria diretório se não existir
-    os.makedirs(os.path.dirname(test_csv_path), exist_ok=True)
-    
-    # Salva dados de exemplo
-    sample_payroll_data.to_csv(test_csv_path, index=False)
-    
-    yield test_csv_path
-    
-    # Limpa arquivo após teste
-    if os.path.exists(test_csv_path):
-        os.remove(test_csv_path)
+@pytest.fixture(scope="module")
+def rag(sample_payroll_data):
+    """PayrollRAG sobre os dados de exemplo em memória, compartilhado pelos testes do módulo"""
+    return PayrollRAG(data=sample_payroll_data)
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_environment():
     """Variáveis de ambiente mock"""
     return {
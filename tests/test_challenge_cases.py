@@ -4,66 +4,59 @@ Implementa validação das respostas esperadas conforme especificação
 """
 import pytest
 import pandas as pd
-import os
 from unittest.mock import Mock, patch, AsyncMock
+from types import MappingProxyType
 from typing import Dict, Any
 
-# Importa módulos do projeto
-import sys
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'app'))
+# Importa módulos do projeto (a raiz está no pythonpath do pytest.ini)
+from app.tools.payroll_rag import PayrollRAG
+from app.utils.formatting import format_currency, format_date
+from app.utils.models import ChatRequest, ChatResponse, Evidence
 
-from tools.payroll_rag import PayrollRAG
-from utils.formatting import format_currency, format_date
-from utils.models import ChatRequest, ChatResponse, Evidence
+# Valores esperados nos casos do desafio (somente leitura)
+_CHALLENGE_DATA = MappingProxyType({
+    "ana_souza": {
+        "employee_id": "E001",
+        "name": "Ana Souza",
+        "may_2025": {
+            "net_pay": 8418.75,
+            "competency": "2025-05",
+            "payment_date": "2025-05-28"
+        },
+        "q1_2025": {
+            "jan": 7725.0,
+            "feb": 7447.5,
+            "mar": 8048.75,
+            "total": 23221.25
+        }
+    },
+    "bruno_lima": {
+        "employee_id": "E002",
+        "name": "Bruno Lima",
+        "june_2025": {
+            "inss": 660.0,
+            "competency": "2025-06"
+        },
+        "april_2025": {
+            "net_pay": 5756.25,
+            "payment_date": "2025-04-28",
+            "competency": "2025-04"
+        },
+        "may_2025": {
+            "bonus": 1200.0,
+            "competency": "2025-05"
+        }
+    }
+})
 
 class TestChallengeCases:
     """Testes para casos específicos do desafio"""
     
-    @pytest.fixture
-    def payroll_rag(self):
-        """Fixture para PayrollRAG com dados do desafio"""
-        csv_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'payroll.csv')
-        return PayrollRAG(csv_path)
-    
-    @pytest.fixture
+    @pytest.fixture(scope="session")
     def challenge_data(self):
         """Dados específicos do desafio"""
-        return {
-            "ana_souza": {
-                "employee_id": "E001",
-                "name": "Ana Souza",
-                "may_2025": {
-                    "net_pay": 8418.75,
-                    "competency": "2025-05",
-                    "payment_date": "2025-05-28"
-                },
-                "q1_2025": {
-                    "jan": 7725.0,
-                    "feb": 7447.5,
-                    "mar": 8048.75,
-                    "total": 23221.25
-                }
-            },
-            "bruno_lima": {
-                "employee_id": "E002",
-                "name": "Bruno Lima",
-                "june_2025": {
-                    "inss": 660.0,
-                    "competency": "2025-06"
-                },
-                "april_2025": {
-                    "net_pay": 5756.25,
-                    "payment_date": "2025-04-28",
-                    "competency": "2025-04"
-                },
-                "may_2025": {
-                    "bonus": 1200.0,
-                    "competency": "2025-05"
-                }
-            }
-        }
+        return _CHALLENGE_DATA
     
-    @pytest.mark.asyncio
     async def test_case_1_ana_souza_may_2025(self, payroll_rag, challenge_data):
         """
         Caso 1: "Quanto recebi (líquido) em maio/2025? (Ana Souza)"
@@ -92,7 +85,6 @@ class TestChallengeCases:
         assert sources[0]["employee_id"] == "E001"
         assert sources[0]["competency"] == "2025-05"
     
-    @pytest.mark.asyncio
     async def test_case_2_ana_souza_q1_2025(self, payroll_rag, challenge_data):
         """
         Caso 2: "Qual o total líquido de Ana Souza no 1º trimestre de 2025?"
@@ -118,7 +110,6 @@ class TestChallengeCases:
         # Verifica total de registros
         assert result["evidence"]["total_records"] == 3
     
-    @pytest.mark.asyncio
     async def test_case_3_bruno_lima_june_2025_inss(self, payroll_rag, challenge_data):
         """
         Caso 3: "Qual foi o desconto de INSS do Bruno em jun/2025?"
@@ -142,7 +133,6 @@ class TestChallengeCases:
         assert result["evidence"]["employee_ids"] == ["E002"]
         assert result["evidence"]["competencies"] == ["2025-06"]
     
-    @pytest.mark.asyncio
     async def test_case_4_bruno_lima_april_2025_payment(self, payroll_rag, challenge_data):
         """
         Caso 4: "Quando foi pago o salário de abril/2025 do Bruno e qual o líquido?"
@@ -169,7 +159,6 @@ class TestChallengeCases:
         assert result["evidence"]["employee_ids"] == ["E002"]
         assert result["evidence"]["competencies"] == ["2025-04"]
     
-    @pytest.mark.asyncio
     async def test_case_5_bruno_lima_highest_bonus(self, payroll_rag, challenge_data):
         """
         Caso 5: "Qual foi o maior bônus do Bruno e em que mês?"
@@ -193,7 +182,6 @@ class TestChallengeCases:
         assert result["evidence"]["employee_ids"] == ["E002"]
         assert result["evidence"]["competencies"] == ["2025-05"]
     
-    @pytest.mark.asyncio
     async def test_date_parsing_variations(self, payroll_rag):
         """Testa parsing de datas em diferentes formatos"""
         test_cases = [
@@ -206,10 +194,9 @@ class TestChallengeCases:
         ]
         
         for input_date, expected in test_cases:
-            parsed = payroll_rag._parse_date_variations(input_date)
+            parsed = payroll_rag._extract_competency(input_date)
             assert parsed == expected, f"Falha ao parsear '{input_date}': esperado {expected}, obtido {parsed}"
     
-    @pytest.mark.asyncio
     async def test_employee_name_extraction(self, payroll_rag):
         """Testa extração de nomes de funcionários"""
         test_cases = [
@@ -223,7 +210,6 @@ class TestChallengeCases:
             extracted = payroll_rag._extract_employee_name(query)
             assert extracted == expected, f"Falha ao extrair nome de '{query}': esperado {expected}, obtido {extracted}"
     
-    @pytest.mark.asyncio
     async def test_competency_extraction(self, payroll_rag):
         """Testa extração de competência"""
         test_cases = [
@@ -263,7 +249,6 @@ class TestChallengeCases:
             formatted = format_date(input_date)
             assert formatted == expected, f"Falha na formatação de {input_date}: esperado {expected}, obtido {formatted}"
     
-    @pytest.mark.asyncio
     async def test_evidence_structure(self, payroll_rag):
         """Testa estrutura das evidências"""
         query = "Qual é o salário do Ana Souza em maio/2025?"
@@ -296,7 +281,6 @@ class TestChallengeCases:
             assert "competency" in source
             assert "payment_date" in source
     
-    @pytest.mark.asyncio
     async def test_error_handling(self, payroll_rag):
         """Testa tratamento de erros"""
         # Funcionário inexistente
@@ -313,7 +297,18 @@ class TestChallengeCases:
         result = await payroll_rag.query("")
         assert result["success"] is False
     
-    @pytest.mark.asyncio
+    async def test_dataframe_source(self, payroll_rag):
+        """Testa PayrollRAG criado a partir de um DataFrame já carregado"""
+        await payroll_rag.query("Quanto recebi em maio/2025? (Ana Souza)")
+        rag = PayrollRAG(data=payroll_rag.df)
+        
+        assert len(rag.df) == len(payroll_rag.df)
+        for query in [
+            "Quanto recebi em maio/2025? (Ana Souza)",
+            "Qual foi o maior bônus do Bruno e em que mês?",
+        ]:
+            assert await rag.query(query) == await payroll_rag.query(query)
+    
     async def test_aggregate_queries(self, payroll_rag):
         """Testa consultas agregadas"""
         # Total líquido
@@ -331,7 +326,6 @@ class TestChallengeCases:
         assert result["success"] is True
         assert "trimestre" in result["data"].lower()
     
-    @pytest.mark.asyncio
     async def test_deduction_queries(self, payroll_rag):
         """Testa consultas de descontos"""
         # INSS
@@ -345,7 +339,6 @@ class TestChallengeCases:
         assert result["success"] is True
         assert "IRRF" in result["data"]
     
-    @pytest.mark.asyncio
     async def test_query_type_detection(self, payroll_rag):
         """Testa detecção de tipo de consulta"""
         test_cases = [
@@ -1,51 +1,55 @@
 """
 Testes para RAG (simples, agregado, formatação)
 """
+import asyncio
 import pytest
 import pandas as pd
-import os
+from contextlib import ExitStack
 from unittest.mock import Mock, patch, AsyncMock
+from datetime import datetime
 from typing import Dict, Any
 
-# Importa módulos do projeto
-import sys
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'app'))
+# Importa módulos do projeto (a raiz está no pythonpath do pytest.ini)
+from app.tools.payroll_rag import PayrollRAG
+from app.tools.web_search import WebSearch
+from app.core.agent import PayrollAgent
+from app.core.llm import LLMConfig
+from app.core.conversation_memory import ConversationMemory
+from app.utils.formatting import format_currency, parse_currency, format_date, parse_date
+from app.utils.models import ChatRequest, ChatResponse
 
-from tools.payroll_rag import PayrollRAG
-from tools.web_search import WebSearch
-from core.agent import PayrollAgent
-from utils.formatting import format_currency, parse_currency, format_date
-from utils.models import ChatRequest, ChatResponse
+# Respostas simuladas do RAG e do LLM nos testes de integração (somente leitura)
+_RAG_RESPONSE = {
+    "data": "João Silva - R$ 7.500,00",
+    "evidence": "Baseado em dados de folha",
+    "success": True
+}
+_LLM_RESPONSE = "O salário do João é R$ 7.500,00"
 
 class TestPayrollRAG:
     """Testes para o sistema RAG"""
     
-    def test_rag_initialization(self, sample_payroll_data, create_test_csv):
-        """Testa inicialização do RAG"""
-        rag = PayrollRAG(create_test_csv)
-        assert rag.df is not None
-        assert len(rag.df) == 4
-    
-    def test_analyze_query_type(self, sample_payroll_data, create_test_csv):
-        """Testa análise do tipo de consulta"""
-        rag = PayrollRAG(create_test_csv)
-        
-        # Testa consulta por funcionário específico
-        assert rag._analyze_query_type("Qual é o salário do João Silva?") == "specific_employee"
-        
-        # Testa consulta agregada
-        assert rag._analyze_query_type("Qual é o salário médio?") == "aggregate"
-        
-        # Testa consulta com filtros
-        assert rag._analyze_query_type("Quem trabalha no departamento de TI?") == "filter"
+    async def test_rag_initialization(self, payroll_rag):
+        """Testa inicialização do RAG: o CSV só é lido na primeira consulta"""
+        rag = PayrollRAG(payroll_rag.csv_path)
+        assert rag.df.empty
         
-        # Testa consulta geral
-        assert rag._analyze_query_type("Olá, como você está?") == "general"
+        result = await rag.query("Quanto recebi em maio/2025? (Ana Souza)")
+        assert result["success"] is True
+        assert len(rag.df) == len(pd.read_csv(payroll_rag.csv_path))
+    
+    @pytest.mark.parametrize("query, expected", [
+        ("Qual é o salário do João Silva?", "specific_employee"),  # funcionário específico
+        ("Qual é o salário médio?", "aggregate"),  # consulta agregada
+        ("Quem trabalha no departamento de TI?", "filter"),  # consulta com filtros
+        ("Olá, como você está?", "general"),  # consulta geral
+    ])
+    def test_analyze_query_type(self, rag, query, expected):
+        """Testa análise do tipo de consulta"""
+        assert rag._analyze_query_type(query) == expected
     
-    def test_extract_employee_name(self, sample_payroll_data, create_test_csv):
+    def test_extract_employee_name(self, rag):
         """Testa extração de nome do funcionário"""
-        rag = PayrollRAG(create_test_csv)
-        
         # Testa extração de nome
         name = rag._extract_employee_name("Qual é o salário do funcionário João Silva?")
         assert name == "João"
@@ -54,54 +58,41 @@ class TestPayrollRAG:
         name = rag._extract_employee_name("Qual é o salário médio?")
         assert name is None
     
-    def test_format_employee_data(self, sample_payroll_data, create_test_csv):
+    def test_format_employee_data(self, rag, sample_payroll_data):
         """Testa formatação de dados do funcionário"""
-        rag = PayrollRAG(create_test_csv)
-        
         # Testa formatação
         formatted = rag._format_employee_data(sample_payroll_data.head(1))
         assert "João Silva" in formatted
         assert "Desenvolvedor" in formatted
         assert "R$ 7.500,00" in formatted
     
-    def test_format_filtered_data(self, sample_payroll_data, create_test_csv):
+    def test_format_filtered_data(self, rag, sample_payroll_data):
         """Testa formatação de dados filtrados"""
-        rag = PayrollRAG(create_test_csv)
-        
         # Testa formatação
         formatted = rag._format_filtered_data(sample_payroll_data.head(2))
         assert "João Silva" in formatted
         assert "Maria Santos" in formatted
     
-    @pytest.mark.asyncio
-    async def test_query_specific_employee(self, sample_payroll_data, create_test_csv):
+    def test_query_specific_employee(self, rag):
         """Testa consulta por funcionário específico"""
-        rag = PayrollRAG(create_test_csv)
-        
         # Mock da extração de nome
         with patch.object(rag, '_extract_employee_name', return_value="João"):
-            result = await rag._query_specific_employee("Qual é o salário do João?")
+            result = rag._query_specific_employee("Qual é o salário do João?")
             
             assert result["success"] is True
             assert "João Silva" in result["data"]
             assert "R$ 7.500,00" in result["data"]
     
-    @pytest.mark.asyncio
-    async def test_query_aggregate(self, sample_payroll_data, create_test_csv):
+    def test_query_aggregate(self, rag):
         """Testa consulta agregada"""
-        rag = PayrollRAG(create_test_csv)
-        
-        result = await rag._query_aggregate("Qual é o salário médio?")
+        result = rag._query_aggregate("Qual é o salário médio?")
         
         assert result["success"] is True
         assert "Total de funcionários: 4" in result["data"]
         assert "R$ 7.375,00" in result["data"]  # Média dos salários
     
-    @pytest.mark.asyncio
-    async def test_query_filter(self, sample_payroll_data, create_test_csv):
+    async def test_query_filter(self, rag):
         """Testa consulta com filtros"""
-        rag = PayrollRAG(create_test_csv)
-        
         # Mock da extração de departamento
         with patch.object(rag, '_extract_department', return_value="TI"):
             result = await rag._query_filter("Quem trabalha no departamento de TI?")
@@ -110,16 +101,33 @@ class TestPayrollRAG:
             assert "João Silva" in result["data"]
             assert "Maria Santos" in result["data"]
     
-    @pytest.mark.asyncio
-    async def test_query_general(self, sample_payroll_data, create_test_csv):
+    async def test_query_general(self, rag):
         """Testa consulta geral"""
-        rag = PayrollRAG(create_test_csv)
-        
         result = await rag._query_general("Informações gerais")
         
         assert result["success"] is True
         assert "Total de funcionários: 4" in result["data"]
         assert "Colunas disponíveis" in result["data"]
+    
+    async def test_intent_key_paraphrases(self, payroll_rag):
+        """Testa que paráfrases compartilham a intenção e meses diferentes não"""
+        await payroll_rag.query("Quanto a Ana recebeu?")  # carrega os dados
+        
+        def intent(query):
+            return payroll_rag._intent_key(payroll_rag._analyze_query(query))
+        
+        may = intent("salário da Ana em maio 2025")
+        assert may is not None
+        assert intent("Ana Souza recebeu quanto em 2025-05?") == may
+        assert intent("salário da Ana em abril 2025") != may
+        
+        # A paráfrase é respondida do cache de intenções
+        with patch.object(payroll_rag, '_query_specific_employee',
+                          wraps=payroll_rag._query_specific_employee) as handler:
+            first = await payroll_rag.query("salário da Ana em junho 2025")
+            second = await payroll_rag.query("Ana Souza recebeu quanto em 2025-06?")
+            assert second == first
+            handler.assert_called_once()
 
 class TestWebSearch:
     """Testes para o sistema de busca na web"""
@@ -151,7 +159,6 @@ class TestWebSearch:
         assert all("trabalho" in result["title"].lower() or "trabalhista" in result["title"].lower() 
                   for result in filtered)
     
-    @pytest.mark.asyncio
     async def test_fallback_search(self):
         """Testa busca de fallback"""
         search = WebSearch()
@@ -166,109 +173,53 @@ class TestWebSearch:
 class TestFormatting:
     """Testes para funções de formatação"""
     
-    def test_format_currency(self):
+    @pytest.mark.parametrize("value, expected", [
+        # Valores numéricos
+        (1500.50, "R$ 1.500,50"),
+        (1000000, "R$ 1.000.000,00"),
+        # Strings
+        ("1500.50", "R$ 1.500,50"),
+        ("R$ 1.500,50", "R$ 1.500,50"),
+        # Valores inválidos
+        ("invalid", "R$ 0,00"),
+    ])
+    def test_format_currency(self, value, expected):
         """Testa formatação de moeda"""
-        # Testa valores numéricos
-        assert format_currency(1500.50) == "R$ 1.500,50"
-        assert format_currency(1000000) == "R$ 1.000.000,00"
-        
-        # Testa strings
-        assert format_currency("1500.50") == "R$ 1.500,50"
-        assert format_currency("R$ 1.500,50") == "R$ 1.500,50"
-        
-        # Testa valores inválidos
-        assert format_currency("invalid") == "R$ 0,00"
-    
-    def test_parse_currency(self):
+        assert format_currency(value) == expected
+    
+    @pytest.mark.parametrize("value, expected", [
+        # Formatos válidos
+        ("R$ 1.500,50", 1500.50),
+        ("R$ 1.000.000,00", 1000000.00),
+        ("1500.50", 1500.50),
+        # Valores inválidos
+        ("invalid", None),
+        ("", None),
+    ])
+    def test_parse_currency(self, value, expected):
         """Testa parsing de moeda"""
-        # Testa formatos válidos
-        assert parse_currency("R$ 1.500,50") == 1500.50
-        assert parse_currency("R$ 1.000.000,00") == 1000000.00
-        assert parse_currency("1500.50") == 1500.50
-        
-        # Testa valores inválidos
-        assert parse_currency("invalid") is None
-        assert parse_currency("") is None
-    
-    def test_format_date(self):
+        assert parse_currency(value) == expected
+    
+    @pytest.mark.parametrize("value, expected", [
+        ("2024-01-01", "01/01/2024"),  # string
+        (datetime(2024, 1, 1), "01/01/2024"),  # datetime
+        ("invalid", "Data inválida"),  # formato inválido
+    ])
+    def test_format_date(self, value, expected):
         """Testa formatação de data"""
-        # Testa string
-        assert format_date("2024-01-01") == "01/01/2024"
-        
-        # Testa datetime
-        from datetime import datetime
-        date_obj = datetime(2024, 1, 1)
-        assert format_date(date_obj) == "01/01/2024"
-        
-        # Testa formato inválido
-        assert format_date("invalid") == "Data inválida"
-    
-    def test_parse_date(self):
+        assert format_date(value) == expected
+    
+    @pytest.mark.parametrize("value, expected", [
+        # Formatos válidos
+        ("01/01/2024", "2024-01-01"),
+        ("01-01-2024", "2024-01-01"),
+        ("2024-01-01", "2024-01-01"),
+        # Formato inválido
+        ("invalid", None),
+    ])
+    def test_parse_date(self, value, expected):
         """Testa parsing de data"""
-        # Testa formatos válidos
-        assert parse_date("01/01/2024") == "2024-01-01"
-        assert parse_date("01-01-2024") == "2024-01-01"
-        assert parse_date("2024-01-01") == "2024-01-01"
-        
-        # Testa formato inválido
-        assert parse_date("invalid") is None
-    
-    def test_validate_date_range(self):
-        """Testa validação de intervalo de datas"""
-        # Testa intervalo válido
-        assert validate_date_range("2024-01-01", "2024-12-31") is True
-        
-        # Testa intervalo inválido
-        assert validate_date_range("2024-12-31", "2024-01-01") is False
-        
-        # Testa datas inválidas
-        assert validate_date_range("invalid", "2024-01-01") is False
-    
-    def test_format_percentage(self):
-        """Testa formatação de porcentagem"""
-        assert format_percentage(15.5) == "15.50%"
-        assert format_percentage(100) == "100.00%"
-        assert format_percentage("invalid") == "0,00%"
-    
-    def test_format_number(self):
-        """Testa formatação de números"""
-        assert format_number(1500.50) == "1.500,50"
-        assert format_number(1000000) == "1.000.000,00"
-        assert format_number("invalid") == "0,00"
-    
-    def test_clean_text(self):
-        """Testa limpeza de texto"""
-        assert clean_text("  João   Silva  ") == "João Silva"
-        assert clean_text("João@Silva#123") == "João Silva 123"
-        assert clean_text("") == ""
-        assert clean_text(None) == ""
-    
-    def test_extract_numbers(self):
-        """Testa extração de números"""
-        assert extract_numbers("R$ 1.500,50") == [1.0, 500.0, 50.0]
-        assert extract_numbers("Salário: 7500.00") == [7500.0]
-        assert extract_numbers("Sem números") == []
-    
-    def test_format_employee_name(self):
-        """Testa formatação de nome do funcionário"""
-        assert format_employee_name("joão silva") == "João Silva"
-        assert format_employee_name("MARIA SANTOS") == "Maria Santos"
-        assert format_employee_name("") == ""
-        assert format_employee_name(None) == ""
-    
-    def test_format_department_name(self):
-        """Testa formatação de nome do departamento"""
-        assert format_department_name("ti") == "TI"
-        assert format_department_name("recursos humanos") == "RECURSOS HUMANOS"
-        assert format_department_name("") == ""
-        assert format_department_name(None) == ""
-    
-    def test_format_position_name(self):
-        """Testa formatação de nome do cargo"""
-        assert format_position_name("desenvolvedor") == "Desenvolvedor"
-        assert format_position_name("ANALISTA DE SISTEMAS") == "Analista De Sistemas"
-        assert format_position_name("") == ""
-        assert format_position_name(None) == ""
+        assert parse_date(value) == expected
 
 class TestModels:
     """Testes para modelos Pydantic"""
@@ -317,64 +268,234 @@ class TestModels:
         assert stats.total_funcionarios == 150
         assert stats.salario_medio == 5500.00
 
+class TestConversationMemory:
+    """Testes para a memória de conversa"""
+    
+    def test_export_import_round_trip(self):
+        """Testa que o JSON exportado é o mesmo documento de export_session"""
+        memory = ConversationMemory()
+        session_id = memory.create_session()
+        memory.add_message(session_id, "user", "Quanto recebi em maio/2025? (Ana Souza)")
+        memory.add_message(
+            session_id, "assistant", "Você recebeu R$ 8.418,75",
+            tool_used="rag", evidence={"employee_ids": ["E001"]}
+        )
+        memory.update_context_data(session_id, "last_query_type", "rag")
+        exported = memory.export_session(session_id)
+        
+        restored = ConversationMemory()
+        assert restored.import_session_bytes(memory.export_session_bytes(session_id)) is True
+        assert restored.export_session(session_id) == exported
+        assert restored.get_context_summary(session_id)["employee_mentions"] == ["Ana Souza"]
+
+class TestLLMConfig:
+    """Testes das chamadas ao LLM"""
+    
+    @pytest.fixture
+    def llm(self, monkeypatch):
+        """LLMConfig com o cliente da OpenAI simulado; a chamada fica presa até release"""
+        monkeypatch.setenv("OPENAI_API_KEY", "test_openai_key")
+        llm = LLMConfig()
+        release = asyncio.Event()
+        
+        async def create(**kwargs):
+            await release.wait()
+            return Mock(choices=[Mock(message=Mock(content=" " + _LLM_RESPONSE + " "))])
+        
+        client = Mock()
+        client.chat.completions.create = AsyncMock(side_effect=create)
+        llm.__dict__["client"] = client
+        return llm, client, release
+    
+    async def test_concurrent_calls_coalesced(self, llm):
+        """Testa que duas chamadas idênticas simultâneas fazem uma única requisição"""
+        llm, client, release = llm
+        calls = asyncio.gather(
+            llm.generate_response("Como calcular férias?"),
+            llm.generate_response("Como calcular férias?")
+        )
+        await asyncio.sleep(0)
+        release.set()
+        
+        assert await calls == [_LLM_RESPONSE, _LLM_RESPONSE]
+        client.chat.completions.create.assert_awaited_once()
+    
+    async def test_cancel_one_caller(self, llm):
+        """Testa que cancelar um pedido não cancela o outro que aguarda a mesma chamada"""
+        llm, client, release = llm
+        first = asyncio.create_task(llm.generate_response("Como calcular férias?"))
+        second = asyncio.create_task(llm.generate_response("Como calcular férias?"))
+        await asyncio.sleep(0)
+        
+        first.cancel()
+        release.set()
+        
+        assert await second == _LLM_RESPONSE
+        assert first.cancelled()
+        client.chat.completions.create.assert_awaited_once()
+
+@pytest.fixture(scope="module")
+def mocked_agent():
+    """PayrollAgent com LLM, RAG e busca na web simulados, criado uma vez por módulo"""
+    with ExitStack() as stack:
+        mock_llm = stack.enter_context(patch('app.core.agent.LLMConfig'))
+        mock_rag = stack.enter_context(patch('app.core.agent.PayrollRAG'))
+        mock_web = stack.enter_context(patch('app.core.agent.WebSearch'))
+        
+        # Mock das ferramentas
+        mock_llm.return_value = Mock()
+        mock_rag.return_value = Mock()
+        mock_web.return_value = Mock()
+        
+        yield PayrollAgent(), mock_llm, mock_rag, mock_web
+
+@pytest.fixture
+def agent_mocks(mocked_agent):
+    """Agente compartilhado com o cache de respostas e os mocks zerados"""
+    mocked_agent[0]._response_cache.clear()
+    for mock in mocked_agent[1:]:
+        mock.reset_mock()
+    return mocked_agent
+
 class TestIntegration:
     """Testes de integração"""
     
-    @pytest.mark.asyncio
-    async def test_agent_initialization(self):
+    async def test_agent_initialization(self, agent_mocks):
         """Testa inicialização do agente"""
-        with patch('core.llm.LLMConfig') as mock_llm:
-            mock_llm.return_value = Mock()
-            
-            agent = PayrollAgent()
-            assert agent.llm is not None
-            assert agent.rag is not None
-            assert agent.web_search is not None
+        agent = agent_mocks[0]
+        assert agent.llm is not None
+        assert agent.rag is not None
+        assert agent.web_search is not None
     
-    @pytest.mark.asyncio
-    async def test_agent_tool_decision(self):
+    async def test_agent_tool_decision(self, agent_mocks):
         """Testa decisão de ferramenta do agente"""
-        with patch('core.llm.LLMConfig') as mock_llm:
-            mock_llm.return_value = Mock()
-            
-            agent = PayrollAgent()
-            
-            # Testa decisão para RAG
-            decision = await agent._decide_tool("Qual é o salário do João?")
-            assert decision == "rag"
-            
-            # Testa decisão para web
-            decision = await agent._decide_tool("Como calcular férias?")
-            assert decision == "web"
-            
-            # Testa decisão geral
-            decision = await agent._decide_tool("Olá, como você está?")
-            assert decision == "general"
+        agent = agent_mocks[0]
+        
+        # Testa decisão para RAG
+        decision = await agent._decide_tool("Qual é o salário do João?")
+        assert decision == "rag"
+        
+        # Testa decisão para web
+        decision = await agent._decide_tool("Como calcular férias?")
+        assert decision == "web"
+        
+        # Testa decisão geral
+        decision = await agent._decide_tool("Olá, como você está?")
+        assert decision == "general"
     
-    @pytest.mark.asyncio
-    async def test_agent_process_query(self):
+    async def test_agent_process_query(self, agent_mocks):
         """Testa processamento de consulta pelo agente"""
-        with patch('core.llm.LLMConfig') as mock_llm, \
-             patch('tools.payroll_rag.PayrollRAG') as mock_rag, \
-             patch('tools.web_search.WebSearch') as mock_web:
-            
-            # Mock das ferramentas
-            mock_llm.return_value = Mock()
-            mock_rag.return_value = Mock()
-            mock_web.return_value = Mock()
-            
-            # Mock da resposta do RAG
-            mock_rag.return_value.query = AsyncMock(return_value={
-                "data": "João Silva - R$ 7.500,00",
-                "evidence": "Baseado em dados de folha",
-                "success": True
-            })
-            
-            # Mock da resposta do LLM
-            mock_llm.return_value.generate_response = AsyncMock(return_value="O salário do João é R$ 7.500,00")
-            
-            agent = PayrollAgent()
-            result = await agent.process_query("Qual é o salário do João?")
-            
-            assert result["response"] == "O salário do João é R$ 7.500,00"
-            assert result["tool_used"] == "rag"
+        agent, mock_llm, mock_rag, mock_web = agent_mocks
+        
+        # Mock da resposta do RAG
+        mock_rag.return_value.query = AsyncMock(return_value=_RAG_RESPONSE)
+        
+        # Mock da resposta do LLM
+        mock_llm.return_value.generate_response = AsyncMock(return_value=_LLM_RESPONSE)
+        
+        result = await agent.process_query("Qual é o salário do João?")
+        
+        assert result["response"] == _LLM_RESPONSE
+        assert result["tool_used"] == "rag"
+    
+    def test_hybrid_routing_flag(self):
+        """Testa que pontuações próximas só viram "hybrid" com a flag ligada"""
+        class HybridAgent(PayrollAgent):
+            HYBRID_ROUTING = True
+        
+        message = PayrollAgent._normalize_message("Qual é o salário do João?")
+        assert PayrollAgent._analyze_query_type(message) == "rag"
+        assert HybridAgent._analyze_query_type(message) == "hybrid"
+    
+    async def test_hybrid_reply_prefers_rag(self, agent_mocks):
+        """Testa que a consulta ambígua com dados na folha não chega a buscar na web"""
+        agent, _, mock_rag, mock_web = agent_mocks
+        mock_rag.return_value.query = AsyncMock(return_value=_RAG_RESPONSE)
+        mock_web.return_value.search_with_citation = AsyncMock()
+        
+        plan = await agent._plan_hybrid_reply("Qual é o salário do João?")
+        
+        assert plan["tool_used"] == "rag"
+        mock_web.return_value.search_with_citation.assert_not_awaited()
+    
+    async def test_hybrid_reply_falls_back_to_web(self, agent_mocks):
+        """Testa que a consulta ambígua sem dados na folha usa a busca na web"""
+        agent, _, mock_rag, mock_web = agent_mocks
+        mock_rag.return_value.query = AsyncMock(
+            return_value={"data": "Nenhum dado encontrado", "evidence": [], "success": False}
+        )
+        mock_web.return_value.search_with_citation = AsyncMock(return_value={
+            "data": "INSS: alíquotas de 7,5% a 14%",
+            "evidence": [{"title": "Tabela INSS", "url": "https://www.gov.br/inss"}],
+            "success": True
+        })
+        
+        plan = await agent._plan_hybrid_reply("Qual é o desconto de INSS do João?")
+        
+        assert plan["tool_used"] == "web"
+        mock_web.return_value.search_with_citation.assert_awaited_once()
+
+def _llm_stream(*parts, error=None):
+    """Simula generate_response_stream: emite os trechos e, se pedido, falha"""
+    async def stream(message, context=None):
+        for part in parts:
+            yield part
+        if error is not None:
+            raise error
+    return Mock(side_effect=stream)
+
+async def _collect(agent, message):
+    """Consome process_query_stream e devolve a lista de eventos"""
+    return [event async for event in agent.process_query_stream(message)]
+
+class TestStreaming:
+    """Testes da resposta transmitida (SSE)"""
+    
+    async def test_stream_event_order(self, agent_mocks):
+        """Testa a ordem meta, token(s), done"""
+        agent, mock_llm, mock_rag, _ = agent_mocks
+        mock_rag.return_value.query = AsyncMock(return_value=_RAG_RESPONSE)
+        mock_llm.return_value.generate_response_stream = _llm_stream("O salário do João ", "é R$ 7.500,00")
+        
+        events = await _collect(agent, "Qual é o salário do João?")
+        
+        assert [event["event"] for event in events] == ["meta", "token", "token", "done"]
+        assert events[0]["tool_used"] == "rag"
+        assert events[0]["session_id"] == events[-1]["session_id"]
+        assert "".join(event["content"] for event in events[1:-1]) == _LLM_RESPONSE
+    
+    async def test_stream_fallback_before_first_token(self, agent_mocks):
+        """Testa que a falha do LLM antes do primeiro trecho emite a resposta pronta"""
+        agent, mock_llm, mock_rag, _ = agent_mocks
+        mock_rag.return_value.query = AsyncMock(return_value=_RAG_RESPONSE)
+        mock_llm.return_value.generate_response_stream = _llm_stream(error=RuntimeError("timeout"))
+        
+        events = await _collect(agent, "Qual é o salário do João?")
+        
+        assert [event["event"] for event in events] == ["meta", "token", "done"]
+        assert _RAG_RESPONSE["data"] in events[1]["content"]
+        # A resposta pronta não fica no cache: a próxima consulta chama o LLM de novo
+        assert len(agent._response_cache) == 0
+    
+    async def test_stream_caches_only_completed(self, agent_mocks):
+        """Testa que só respostas transmitidas até o fim ficam no cache"""
+        agent, mock_llm, mock_rag, _ = agent_mocks
+        mock_rag.return_value.query = AsyncMock(return_value=_RAG_RESPONSE)
+        
+        # Falha no meio da transmissão: erro e nada no cache
+        mock_llm.return_value.generate_response_stream = _llm_stream(
+            "O salário ", error=RuntimeError("conexão perdida")
+        )
+        events = await _collect(agent, "Qual é o salário do João?")
+        assert [event["event"] for event in events] == ["meta", "token", "error"]
+        assert len(agent._response_cache) == 0
+        
+        # Transmissão completa: a mesma consulta depois vem do cache
+        mock_llm.return_value.generate_response_stream = _llm_stream(_LLM_RESPONSE)
+        await _collect(agent, "Qual é o salário do João?")
+        assert len(agent._response_cache) == 1
+        
+        events = await _collect(agent, "Qual é o salário do João?")
+        assert [event["event"] for event in events] == ["meta", "token", "done"]
+        assert events[1]["content"] == _LLM_RESPONSE
+        mock_llm.return_value.generate_response_stream.assert_called_once()